@@ -0,0 +1,890 @@
+#!/usr/bin/env python3
+"""Dynamic rerouting with TLS-aware edge weights (TraCI + NetworkX).
+
+Counterpart to the static-routing baseline: every REROUTE_PERIOD seconds
+each vehicle is rerouted on an edge-as-node graph whose movement costs
+combine smoothed edge speeds, occupancy and the expected delay at the
+traffic light controlling the movement.
+"""
+import os
+import sys
+import csv
+import math
+import heapq
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+if "SUMO_HOME" in os.environ:
+    sys.path.append(os.path.join(os.environ["SUMO_HOME"], "tools"))
+
+import networkx as nx
+import sumolib
+import traci
+import traci.constants as tc
+
+try:
+    import numpy as np
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra as csr_dijkstra
+except ImportError:  # fall back to the pure-NetworkX search
+    np = None
+
+try:
+    from numba import njit
+except ImportError:  # fall back to the interpreted CSR search
+    njit = None
+if np is None:
+    njit = None
+
+SUMO_CFG = "osm.sumocfg"
+NET_FILE = "osm.net.xml.gz"
+AGG_CSV = "aggregate_results_tls.csv"
+
+# opt-in: publish travel times via adaptTraveltime and let SUMO's C++
+# router replace the Python search (SUMO_NATIVE_ROUTER=1); off by
+# default because the point of this script is benchmarking our router
+USE_NATIVE_ROUTER = os.environ.get("SUMO_NATIVE_ROUTER", "") == "1"
+
+REROUTE_PERIOD = 15.0          # s between reroute attempts per vehicle
+REROUTE_HORIZON_K = 5          # route edges checked by the congestion gate
+TLS_LOOKAHEAD_LIMIT = 300.0    # s of phase scanning per signal
+WINDOW_N = 10                  # smoothing window for edge speed/occupancy
+OCCUPANCY_FREE_THRESH = 0.05   # below this an edge counts as free-flowing
+DENSITY_ALPHA = 2.0            # occupancy penalty factor
+SMOOTHING_MIN_SPEED = 0.5      # m/s; below this the mean speed is unreliable
+MIN_SPEED_FRACTION = 0.25      # fallback fraction of the speed limit
+
+# vehicle variables fetched in one bulk subscription result per step
+VEH_VARS = [
+    tc.VAR_WAITING_TIME,
+    tc.VAR_ACCUMULATED_WAITING_TIME,
+    tc.VAR_LANE_ID,
+    tc.VAR_LANEPOSITION,
+    tc.VAR_ROAD_ID,
+    tc.VAR_EDGES,
+]
+
+# per-step snapshot of the edge subscription results; every drivable
+# edge is subscribed once at startup
+EDGE_SNAP = {}
+
+# static lane topology, filled once from the parsed network
+LANE_OUT = {}     # lane_id -> tuple of outgoing lane ids
+EDGE_LANES = {}   # edge_id -> tuple of its lane ids
+LANE_ALLOWS = {}  # (lane_id, vclass) -> bool
+_LANE_OBJ = {}    # lane_id -> sumolib lane, for lazy allows() checks
+EDGE_CONN = set()  # (from_edge, to_edge) pairs with a drivable connection
+LANE2EDGE = {}    # lane_id -> edge_id, replaces lane_id.split("_")[0]
+EDGE_LEN = {}     # edge_id -> length
+EDGE_VMAX = {}    # edge_id -> speed limit
+
+# (in_edge, out_edge) -> (tls_id, sig_idx), built once at startup
+MOVE2SIG = {}
+
+# per-step snapshot of the TLS subscription results (current phase and
+# next switch time); the phase programs themselves are static
+TLS_SNAP = {}
+SIM_TIME = 0.0
+
+# (u, v) -> movement cost, valid for one simulation step
+WEIGHT_CACHE = {}
+
+# (vclass, dest_edge) -> (predecessor array, computed_at); reused across
+# steps while the weight refresh reports no significant cost change
+SPT_CACHE = {}
+SPT_REUSE_EPS = 0.05
+SPT_CACHE_MAX = 4096
+
+# rolling speed/occupancy windows per edge: fixed ring-buffer rows plus
+# running sums, so the smoothed values are O(1) updates instead of
+# sum()/len() over a deque on every weight query
+EDGE_ROW = {}
+if np is not None:
+    SPEED_BUF = np.zeros((1024, WINDOW_N), dtype=np.float32)
+    OCC_BUF = np.zeros((1024, WINDOW_N), dtype=np.float32)
+    SPEED_SUM = np.zeros(1024, dtype=np.float64)
+    OCC_SUM = np.zeros(1024, dtype=np.float64)
+    BUF_IDX = np.zeros(1024, dtype=np.int32)
+    BUF_CNT = np.zeros(1024, dtype=np.int32)
+else:
+    EDGE_BUF = defaultdict(lambda: {"speed": deque(maxlen=WINDOW_N),
+                                    "occ": deque(maxlen=WINDOW_N)})
+
+
+def _edge_row(eid):
+    """Ring-buffer row of *eid*, growing the arrays geometrically."""
+    global SPEED_BUF, OCC_BUF, SPEED_SUM, OCC_SUM, BUF_IDX, BUF_CNT
+    row = EDGE_ROW.get(eid)
+    if row is None:
+        row = EDGE_ROW[eid] = len(EDGE_ROW)
+        if row >= SPEED_BUF.shape[0]:
+            n = SPEED_BUF.shape[0] * 2
+            for name in ("SPEED_BUF", "OCC_BUF", "SPEED_SUM", "OCC_SUM",
+                         "BUF_IDX", "BUF_CNT"):
+                old = globals()[name]
+                new = np.zeros((n,) + old.shape[1:], dtype=old.dtype)
+                new[:old.shape[0]] = old
+                globals()[name] = new
+    return row
+
+
+# vid -> vClass; a vehicle's class never changes, so resolve it once on
+# departure and drop it on arrival
+VCLASS_CACHE = {}
+
+
+def get_vehicle_class(vid):
+    """Resolve a vehicle's vClass via its type, cached per vehicle."""
+    if vid in VCLASS_CACHE:
+        return VCLASS_CACHE[vid]
+    try:
+        type_id = traci.vehicle.getTypeID(vid)
+        vclass = traci.vehicletype.getVehicleClass(type_id)
+    except traci.TraCIException:
+        vclass = None
+    VCLASS_CACHE[vid] = vclass
+    return vclass
+
+
+def cache_lane_topology(net):
+    """Fill the static lane tables from the parsed network.
+
+    Lane links and class permissions never change during a run, so the
+    helpers below become plain dict lookups with zero TraCI traffic.
+    """
+    edge_lanes = defaultdict(list)
+    for lane in net.getLanes():
+        lane_id = lane.getID()
+        LANE_OUT[lane_id] = tuple(c.getToLane().getID()
+                                  for c in lane.getOutgoing())
+        _LANE_OBJ[lane_id] = lane
+        LANE2EDGE[lane_id] = lane.getEdge().getID()
+        edge_lanes[lane.getEdge().getID()].append(lane_id)
+    EDGE_LANES.update((eid, tuple(lanes))
+                      for eid, lanes in edge_lanes.items())
+    for edge in net.getEdges(withInternal=False):
+        eid = edge.getID()
+        EDGE_LEN[eid] = edge.getLength()
+        EDGE_VMAX[eid] = edge.getSpeed()
+        for succ in edge.getOutgoing():
+            EDGE_CONN.add((eid, succ.getID()))
+
+
+def _lane_to_edge(lane_id):
+    """Edge id of *lane_id*, with string surgery only for unknown lanes."""
+    eid = LANE2EDGE.get(lane_id)
+    return eid if eid is not None else lane_id.split("_")[0]
+
+
+def _safe_iter_out_lanes(lane_id):
+    """Outgoing lane ids of *lane_id*, () for unknown lanes."""
+    return LANE_OUT.get(lane_id, ())
+
+
+def _lane_allows_class(lane_id, vclass):
+    """Whether *lane_id* permits vehicles of *vclass*."""
+    if vclass is None:
+        return True
+    key = (lane_id, vclass)
+    hit = LANE_ALLOWS.get(key)
+    if hit is None:
+        lane = _LANE_OBJ.get(lane_id)
+        hit = LANE_ALLOWS[key] = lane is None or lane.allows(vclass)
+    return hit
+
+
+def is_uturn_pair(a, b):
+    return a == "-" + b or b == "-" + a
+
+
+def next_edges_allowed_from_current_lane(lane_id, vclass):
+    """Edges reachable from *lane_id* for vehicles of *vclass*."""
+    out = set()
+    for out_lane in _safe_iter_out_lanes(lane_id):
+        if _lane_allows_class(out_lane, vclass):
+            out.add(_lane_to_edge(out_lane))
+    return out
+
+
+def has_edge_connection_any_lane(a, b):
+    """True if any lane of edge *a* links into edge *b*."""
+    return (a, b) in EDGE_CONN
+
+
+def build_edge_graph_from_net(net, vclass):
+    """Edge-as-node graph for one vehicle class, built from the parsed net.
+
+    Topology, lengths, speed limits and class permissions never change
+    during a run, so this replaces the per-lane TraCI interrogation and
+    is built exactly once per class; only the edge weights are dynamic.
+    """
+    G = nx.DiGraph()
+    for edge in net.getEdges(withInternal=False):
+        if vclass is not None and not edge.allows(vclass):
+            continue
+        fx, fy = edge.getFromNode().getCoord()
+        tx, ty = edge.getToNode().getCoord()
+        G.add_node(edge.getID(),
+                   length=edge.getLength(),
+                   speed_limit=edge.getSpeed(),
+                   xy=((fx + tx) / 2.0, (fy + ty) / 2.0))
+    for edge in net.getEdges(withInternal=False):
+        eid = edge.getID()
+        if eid not in G:
+            continue
+        for succ in edge.getOutgoing():
+            out_id = succ.getID()
+            if out_id in G and not is_uturn_pair(eid, out_id):
+                G.add_edge(eid, out_id)
+    G.graph["vmax"] = max((G.nodes[e].get("speed_limit", 13.89)
+                           for e in G.nodes), default=13.89)
+    return G
+
+
+def subscribe_all_edges(net):
+    """Subscribe every drivable edge to the dynamic state bulk result."""
+    for edge in net.getEdges(withInternal=False):
+        traci.edge.subscribe(edge.getID(), [tc.LAST_STEP_OCCUPANCY,
+                                            tc.LAST_STEP_MEAN_SPEED])
+
+
+def _edge_state(eid):
+    """Occupancy and mean speed of *eid* from the per-step snapshot."""
+    state = EDGE_SNAP.get(eid)
+    if state is None:
+        return 0.0, -1.0
+    return (state.get(tc.LAST_STEP_OCCUPANCY, 0.0),
+            state.get(tc.LAST_STEP_MEAN_SPEED, -1.0))
+
+
+def expected_speed(eid, speed_limit):
+    """Smoothed effective speed and occupancy on *eid*."""
+    occ, mean_speed = _edge_state(eid)
+    spd = mean_speed if mean_speed >= 0 else speed_limit
+    if np is not None:
+        r = _edge_row(eid)
+        i = BUF_IDX[r]
+        if BUF_CNT[r] == WINDOW_N:
+            SPEED_SUM[r] -= SPEED_BUF[r, i]
+            OCC_SUM[r] -= OCC_BUF[r, i]
+        else:
+            BUF_CNT[r] += 1
+        SPEED_BUF[r, i] = spd
+        OCC_BUF[r, i] = occ
+        SPEED_SUM[r] += SPEED_BUF[r, i]
+        OCC_SUM[r] += OCC_BUF[r, i]
+        BUF_IDX[r] = (i + 1) % WINDOW_N
+        cnt = BUF_CNT[r]
+        sm_speed = SPEED_SUM[r] / cnt
+        sm_occ = OCC_SUM[r] / cnt
+    else:
+        buf = EDGE_BUF[eid]
+        buf["speed"].append(spd)
+        buf["occ"].append(occ)
+        sm_speed = sum(buf["speed"]) / len(buf["speed"])
+        sm_occ = sum(buf["occ"]) / len(buf["occ"])
+    if sm_occ < OCCUPANCY_FREE_THRESH:
+        return speed_limit, sm_occ
+    if sm_speed > SMOOTHING_MIN_SPEED:
+        return sm_speed, sm_occ
+    return speed_limit * MIN_SPEED_FRACTION, sm_occ
+
+
+def subscribe_all_tls():
+    """Subscribe every TLS to its dynamic phase state."""
+    for tls_id in traci.trafficlight.getIDList():
+        traci.trafficlight.subscribe(tls_id, [tc.TL_CURRENT_PHASE,
+                                              tc.TL_NEXT_SWITCH])
+
+
+def cache_tls_definitions():
+    """Phase programs of every TLS, fetched once at startup.
+
+    Alongside the raw (state, duration) list, the durations and a
+    boolean green matrix are stored as arrays so the delay scan in
+    tls_delay_seconds is vectorized instead of phase-by-phase Python.
+    """
+    tls_defs = {}
+    for tls_id in traci.trafficlight.getIDList():
+        try:
+            logics = traci.trafficlight.getAllProgramLogics(tls_id)
+        except traci.TraCIException:
+            continue
+        if not logics:
+            continue
+        phases = [(ph.state, ph.duration) for ph in logics[0].phases]
+        entry = {"phases": phases}
+        if np is not None and phases:
+            entry["durs"] = np.array([dur for _state, dur in phases],
+                                     dtype=np.float64)
+            n_sigs = max(len(state) for state, _dur in phases)
+            entry["green"] = np.array(
+                [[i < len(state) and state[i] in "Gg"
+                  for i in range(n_sigs)] for state, _dur in phases],
+                dtype=bool)
+        tls_defs[tls_id] = entry
+    return tls_defs
+
+
+def build_tls_linkmap():
+    """Per-TLS list of (in_edge, out_edge, signal index) movements.
+
+    Also refills the flat MOVE2SIG lookup so the weight function can map a
+    movement to its signal with one dict probe instead of scanning every
+    TLS on each edge relaxation.
+    """
+    linkmap = {}
+    MOVE2SIG.clear()
+    for tls_id in traci.trafficlight.getIDList():
+        maps = []
+        try:
+            controlled = traci.trafficlight.getControlledLinks(tls_id)
+        except traci.TraCIException:
+            continue
+        for sig_idx, links in enumerate(controlled):
+            for in_lane, out_lane, _via in links:
+                in_edge = _lane_to_edge(in_lane)
+                out_edge = _lane_to_edge(out_lane)
+                maps.append((in_edge, out_edge, sig_idx))
+                MOVE2SIG[(in_edge, out_edge)] = (tls_id, sig_idx)
+        linkmap[tls_id] = maps
+    return linkmap
+
+
+def expected_tls_delay_for_movement(u, v, tls_defs, tls_linkmap):
+    """Expected signal delay for the movement u -> v."""
+    hit = MOVE2SIG.get((u, v))
+    if hit is None:
+        return 0.0
+    return tls_delay_seconds(hit[0], hit[1], tls_defs)
+
+
+def tls_delay_seconds(tls_id, sig_idx, tls_defs):
+    """Seconds until signal *sig_idx* at *tls_id* next shows green."""
+    entry = tls_defs.get(tls_id)
+    if not entry or not entry["phases"]:
+        return 0.0
+    phases = entry["phases"]
+    snap = TLS_SNAP.get(tls_id)
+    if snap is None:
+        return 0.0
+    cur = snap.get(tc.TL_CURRENT_PHASE, 0)
+    remain = snap.get(tc.TL_NEXT_SWITCH, SIM_TIME) - SIM_TIME
+    if cur >= len(phases):
+        return 0.0
+    if np is not None and "green" in entry:
+        green = entry["green"]
+        if sig_idx >= green.shape[1]:
+            return 0.0
+        if green[cur, sig_idx]:
+            return 0.0
+        # phases after the current one, in wrapped order
+        order = np.arange(cur + 1, cur + len(phases)) % len(phases)
+        greens = green[order, sig_idx]
+        delay = max(remain, 0.0)
+        if not greens.any():
+            return delay + float(entry["durs"][order].sum())
+        k = int(np.argmax(greens))
+        if k:
+            delay += float(np.cumsum(entry["durs"][order])[k - 1])
+        return delay
+    state = phases[cur][0]
+    if sig_idx < len(state) and state[sig_idx] in "Gg":
+        return 0.0
+    delay = max(remain, 0.0)
+    idx = (cur + 1) % len(phases)
+    scanned = 0.0
+    while scanned < TLS_LOOKAHEAD_LIMIT:
+        st, dur = phases[idx]
+        if sig_idx < len(st) and st[sig_idx] in "Gg":
+            return delay
+        delay += dur
+        scanned += dur
+        idx = (idx + 1) % len(phases)
+    return delay
+
+
+def movement_weight(u, v, length, speed_limit, tls_defs, tls_linkmap):
+    """Cost of traversing edge *v* when entered from *u*.
+
+    Dijkstra re-evaluates the same movement on every relaxation, so the
+    result is memoized for the duration of the current step.
+    """
+    cached = WEIGHT_CACHE.get((u, v))
+    if cached is not None:
+        return cached
+    use_speed, sm_occ = expected_speed(v, speed_limit)
+    cost = length / max(use_speed, 0.1) * (1.0 + DENSITY_ALPHA * sm_occ)
+    cost += expected_tls_delay_for_movement(u, v, tls_defs, tls_linkmap)
+    WEIGHT_CACHE[(u, v)] = cost
+    return cost
+
+
+def build_routing_arrays(net, vclass):
+    """Compact SoA routing graph for one vehicle class.
+
+    Replaces the nx.DiGraph on the SciPy/Numba path: lengths, speed
+    limits and coordinates live in contiguous arrays indexed by integer
+    edge id, with CSR adjacency alongside. That is both lighter to hold
+    and faster to iterate than per-node attribute dicts.
+    """
+    edges = [e for e in net.getEdges(withInternal=False)
+             if vclass is None or e.allows(vclass)]
+    ids = [e.getID() for e in edges]
+    edge2ix = {eid: i for i, eid in enumerate(ids)}
+    xy = np.empty((len(edges), 2), dtype=np.float64)
+    for i, e in enumerate(edges):
+        fx, fy = e.getFromNode().getCoord()
+        tx, ty = e.getToNode().getCoord()
+        xy[i, 0] = (fx + tx) / 2.0
+        xy[i, 1] = (fy + ty) / 2.0
+    length = np.array([e.getLength() for e in edges], dtype=np.float64)
+    speed_limit = np.array([e.getSpeed() for e in edges], dtype=np.float64)
+    indptr = [0]
+    indices = []
+    pairs = []
+    for e in edges:
+        eid = e.getID()
+        for succ in e.getOutgoing():
+            out_ix = edge2ix.get(succ.getID())
+            if out_ix is None or is_uturn_pair(eid, succ.getID()):
+                continue
+            indices.append(out_ix)
+            pairs.append((eid, succ.getID()))
+        indptr.append(len(indices))
+    return {
+        "ids": ids,
+        "edge2ix": edge2ix,
+        "indptr": np.asarray(indptr, dtype=np.int32),
+        "indices": np.asarray(indices, dtype=np.int32),
+        "pairs": pairs,
+        "data": np.ones(len(indices), dtype=np.float64),
+        "xy": xy,
+        "length": length,
+        "speed_limit": speed_limit,
+        "vmax": float(speed_limit.max()) if len(edges) else 13.89,
+        "matrix": None,
+        "matrix_rev": None,
+        "step": -1.0,
+    }
+
+
+def refresh_csr_weights(csr, tls_defs, tls_linkmap):
+    """Re-evaluate every movement cost against the current snapshot."""
+    data = csr["data"]
+    indices = csr["indices"]
+    length = csr["length"]
+    speed_limit = csr["speed_limit"]
+    old = data.copy()
+    for k, (u, v) in enumerate(csr["pairs"]):
+        v_ix = indices[k]
+        data[k] = movement_weight(u, v, length[v_ix], speed_limit[v_ix],
+                                  tls_defs, tls_linkmap)
+    # largest relative cost change, consulted by the SPT reuse check
+    if data.shape[0]:
+        csr["max_delta"] = float(np.max(np.abs(data - old)
+                                        / np.maximum(old, 1e-9)))
+    else:
+        csr["max_delta"] = 0.0
+    n = len(csr["ids"])
+    csr["matrix"] = csr_matrix((data, indices, csr["indptr"]),
+                               shape=(n, n))
+    csr["matrix_rev"] = csr["matrix"].T.tocsr()
+
+
+if njit is not None:
+    @njit(cache=True, nogil=True)
+    def _astar_kernel(indptr, indices, data, xy, src, dst, vmax):
+        """A* relaxation loop compiled to native code.
+
+        Hand-rolled binary heap on preallocated arrays (numba does not
+        lift heapq); returns the predecessor array, -1 for unreached.
+        """
+        n = indptr.shape[0] - 1
+        dist = np.full(n, np.inf)
+        prev = np.full(n, -1, np.int32)
+        done = np.zeros(n, np.uint8)
+        cap = indices.shape[0] + 2
+        heap_f = np.empty(cap, np.float64)
+        heap_v = np.empty(cap, np.int32)
+        size = 0
+        tx = xy[dst, 0]
+        ty = xy[dst, 1]
+
+        dist[src] = 0.0
+        dx = xy[src, 0] - tx
+        dy = xy[src, 1] - ty
+        heap_f[0] = (dx * dx + dy * dy) ** 0.5 / vmax
+        heap_v[0] = src
+        size = 1
+
+        while size > 0:
+            u = heap_v[0]
+            # pop-min: move last element down from the root
+            size -= 1
+            f = heap_f[size]
+            v0 = heap_v[size]
+            i = 0
+            while True:
+                c = 2 * i + 1
+                if c >= size:
+                    break
+                if c + 1 < size and heap_f[c + 1] < heap_f[c]:
+                    c += 1
+                if heap_f[c] >= f:
+                    break
+                heap_f[i] = heap_f[c]
+                heap_v[i] = heap_v[c]
+                i = c
+            heap_f[i] = f
+            heap_v[i] = v0
+
+            if u == dst:
+                break
+            if done[u]:
+                continue
+            done[u] = 1
+            du = dist[u]
+            for k in range(indptr[u], indptr[u + 1]):
+                v = indices[k]
+                if done[v]:
+                    continue
+                alt = du + data[k]
+                if alt < dist[v]:
+                    dist[v] = alt
+                    prev[v] = u
+                    dx = xy[v, 0] - tx
+                    dy = xy[v, 1] - ty
+                    fv = alt + (dx * dx + dy * dy) ** 0.5 / vmax
+                    # sift-up insert
+                    i = size
+                    size += 1
+                    while i > 0:
+                        p = (i - 1) // 2
+                        if heap_f[p] <= fv:
+                            break
+                        heap_f[i] = heap_f[p]
+                        heap_v[i] = heap_v[p]
+                        i = p
+                    heap_f[i] = fv
+                    heap_v[i] = v
+        return prev
+
+
+def csr_astar(csr, src, dst):
+    """Goal-directed A* over the CSR arrays.
+
+    Heuristic: straight-line distance to the target edge divided by the
+    network's top speed. That is an admissible travel-time lower bound,
+    so the first time *dst* is popped its label is optimal, and the
+    frontier stays focused on the corridor towards the target instead of
+    flooding the whole city graph.
+    """
+    edge2ix = csr["edge2ix"]
+    src_ix = edge2ix.get(src)
+    dst_ix = edge2ix.get(dst)
+    if src_ix is None or dst_ix is None:
+        return None
+    if njit is not None:
+        prev_arr = _astar_kernel(csr["indptr"], csr["indices"], csr["data"],
+                                 csr["xy"], src_ix, dst_ix, csr["vmax"])
+        if prev_arr[dst_ix] < 0 and src_ix != dst_ix:
+            return None
+        path = [csr["ids"][dst_ix]]
+        i = dst_ix
+        while i != src_ix:
+            i = prev_arr[i]
+            path.append(csr["ids"][i])
+        path.reverse()
+        return path
+    indptr = csr["indptr"]
+    indices = csr["indices"]
+    data = csr["data"]
+    xy = csr["xy"]
+    vmax = csr["vmax"]
+    tx, ty = xy[dst_ix]
+
+    dist = {src_ix: 0.0}
+    prev = {}
+    done = set()
+    heap = [(math.hypot(xy[src_ix][0] - tx, xy[src_ix][1] - ty) / vmax,
+             src_ix)]
+    while heap:
+        _f, u = heapq.heappop(heap)
+        if u == dst_ix:
+            break
+        if u in done:
+            continue
+        done.add(u)
+        du = dist[u]
+        for k in range(indptr[u], indptr[u + 1]):
+            v = indices[k]
+            if v in done:
+                continue
+            alt = du + data[k]
+            if alt < dist.get(v, math.inf):
+                dist[v] = alt
+                prev[v] = u
+                h = math.hypot(xy[v][0] - tx, xy[v][1] - ty) / vmax
+                heapq.heappush(heap, (alt + h, v))
+    if dst_ix not in dist:
+        return None
+    path = [csr["ids"][dst_ix]]
+    i = dst_ix
+    while i != src_ix:
+        i = prev[i]
+        path.append(csr["ids"][i])
+    path.reverse()
+    return path
+
+
+def _route_group(csr, dest_edge, members, spt_key, now):
+    """Compute paths for one (class, destination) group.
+
+    Pure array work with no TraCI calls, so it is safe to run off the
+    main thread; SciPy's csgraph and the nogil A* kernel both release
+    the GIL. The reverse tree is kept in SPT_CACHE and reused across
+    steps while the weight refresh reports no significant change.
+    """
+    dst_ix = csr["edge2ix"].get(dest_edge)
+    if dst_ix is None:
+        return [(vid, None, lane_id) for vid, _cur, lane_id in members]
+    pred = None
+    hit = SPT_CACHE.get(spt_key)
+    if (hit is not None and now - hit[1] < REROUTE_PERIOD
+            and csr.get("max_delta", 1.0) < SPT_REUSE_EPS):
+        pred = hit[0]
+    if pred is None:
+        if len(members) == 1:
+            # not worth a full tree for a lone vehicle
+            vid, cur_edge, lane_id = members[0]
+            return [(vid, csr_astar(csr, cur_edge, dest_edge), lane_id)]
+        if len(SPT_CACHE) >= SPT_CACHE_MAX:
+            SPT_CACHE.clear()
+        _dist, pred = csr_dijkstra(csr["matrix_rev"], indices=dst_ix,
+                                   return_predecessors=True)
+        SPT_CACHE[spt_key] = (pred, now)
+    ids = csr["ids"]
+    results = []
+    for vid, cur_edge, lane_id in members:
+        src_ix = csr["edge2ix"].get(cur_edge)
+        path = None
+        if src_ix is not None and (src_ix == dst_ix or pred[src_ix] >= 0):
+            path = [ids[src_ix]]
+            i = src_ix
+            while i != dst_ix:
+                i = pred[i]
+                path.append(ids[i])
+        results.append((vid, path, lane_id))
+    return results
+
+
+def publish_edge_traveltimes():
+    """Push the current per-edge travel times into SUMO's routing tables."""
+    for eid, length in EDGE_LEN.items():
+        use_speed, sm_occ = expected_speed(eid, EDGE_VMAX[eid])
+        tt = length / max(use_speed, 0.1) * (1.0 + DENSITY_ALPHA * sm_occ)
+        try:
+            traci.edge.adaptTraveltime(eid, tt)
+        except traci.TraCIException:
+            pass
+
+
+def _validated_set_route(vid, path, lane_id, vclass):
+    """Apply *path* if its first hop and every movement are drivable."""
+    if len(path) > 1:
+        allowed_next = next_edges_allowed_from_current_lane(lane_id, vclass)
+        if allowed_next and path[1] not in allowed_next:
+            return False
+    if not all(has_edge_connection_any_lane(x, y)
+               for x, y in zip(path, path[1:])):
+        return False
+    try:
+        traci.vehicle.setRoute(vid, path)
+    except traci.TraCIException:
+        return False
+    return True
+
+
+def main():
+    traci.start([sumolib.checkBinary("sumo"), "-c", SUMO_CFG])
+
+    net = sumolib.net.readNet(NET_FILE)
+    cache_lane_topology(net)
+    subscribe_all_edges(net)
+    edge_graphs = {}  # vclass -> nx.DiGraph
+    csr_graphs = {}   # vclass -> CSR arrays mirroring the graph
+    # static TLS programs are fetched once; only phase state is dynamic
+    tls_defs = cache_tls_definitions()
+    tls_linkmap = build_tls_linkmap()
+    subscribe_all_tls()
+
+    depart_time = {}
+    last_reroute = {}
+    waiting_time = {}
+    # O(1)-memory aggregates; per-arrival lists only grow and are never
+    # needed individually
+    tt_sum = 0.0
+    wt_sum = 0.0
+    n_ok = 0
+    last_tt_publish = -REROUTE_PERIOD
+    executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+
+    global SIM_TIME
+    while traci.simulation.getMinExpectedNumber() > 0:
+        traci.simulationStep()
+        t = traci.simulation.getTime()
+        SIM_TIME = t
+
+        for vid in traci.simulation.getDepartedIDList():
+            traci.vehicle.subscribe(vid, VEH_VARS)
+            get_vehicle_class(vid)
+            depart_time[vid] = t
+            last_reroute[vid] = t
+
+        veh_snap = traci.vehicle.getAllSubscriptionResults()
+        EDGE_SNAP.clear()
+        EDGE_SNAP.update(traci.edge.getAllSubscriptionResults())
+        TLS_SNAP.clear()
+        TLS_SNAP.update(traci.trafficlight.getAllSubscriptionResults())
+        WEIGHT_CACHE.clear()
+
+        # collect eligible vehicles grouped by (class, destination), so one
+        # reverse shortest-path tree can serve every vehicle in a group
+        reroute_groups = defaultdict(list)
+        for vid, snap in veh_snap.items():
+            waiting_time[vid] = snap.get(tc.VAR_ACCUMULATED_WAITING_TIME, 0.0)
+            if t - last_reroute.get(vid, 0.0) < REROUTE_PERIOD:
+                continue
+            cur_edge = snap.get(tc.VAR_ROAD_ID, "")
+            route = snap.get(tc.VAR_EDGES) or ()
+            if not cur_edge or cur_edge.startswith(":") or not route:
+                continue
+            dest_edge = route[-1]
+            if dest_edge.startswith(":") or cur_edge == dest_edge:
+                continue
+            # cheap congestion gate: when the next few edges of the
+            # current route are free-flowing, a reroute cannot improve
+            # anything, so skip the search entirely
+            try:
+                at = route.index(cur_edge)
+            except ValueError:
+                at = -1
+            if at >= 0 and all(
+                    _edge_state(e)[0] < OCCUPANCY_FREE_THRESH
+                    for e in route[at:at + REROUTE_HORIZON_K]):
+                last_reroute[vid] = t
+                continue
+            vclass = get_vehicle_class(vid)
+            reroute_groups[(vclass, dest_edge)].append(
+                (vid, cur_edge, snap.get(tc.VAR_LANE_ID, "")))
+
+        if USE_NATIVE_ROUTER:
+            # hand the search to SUMO's C++ router: publish travel times
+            # once per reroute period, then reroute the eligible vehicles
+            if t - last_tt_publish >= REROUTE_PERIOD:
+                publish_edge_traveltimes()
+                last_tt_publish = t
+            for members in reroute_groups.values():
+                for vid, _cur, _lane in members:
+                    try:
+                        # currentTravelTimes=True would re-adapt every
+                        # edge to its instantaneous time first, undoing
+                        # the published smoothed weights per call
+                        traci.vehicle.rerouteTraveltime(
+                            vid, currentTravelTimes=False)
+                    except traci.TraCIException:
+                        pass
+                    last_reroute[vid] = t
+            reroute_groups.clear()
+
+        group_futures = []
+        for (vclass, dest_edge), members in reroute_groups.items():
+            if np is None:
+                # NetworkX fallback keeps the attribute-dict graph
+                if vclass not in edge_graphs:
+                    edge_graphs[vclass] = build_edge_graph_from_net(net,
+                                                                    vclass)
+                G = edge_graphs[vclass]
+                if dest_edge not in G:
+                    for vid, _cur, _lane in members:
+                        last_reroute[vid] = t
+                    continue
+                for vid, cur_edge, lane_id in members:
+                    if cur_edge not in G:
+                        last_reroute[vid] = t
+                        continue
+
+                    def w(u, v, d, _G=G):
+                        nd = _G.nodes[v]
+                        return movement_weight(u, v, nd.get("length", 1.0),
+                                               nd.get("speed_limit", 13.89),
+                                               tls_defs, tls_linkmap)
+
+                    def h(a, b, _G=G,
+                          _xy=G.nodes[dest_edge].get("xy", (0.0, 0.0))):
+                        xa = _G.nodes[a].get("xy", (0.0, 0.0))
+                        return (math.hypot(xa[0] - _xy[0], xa[1] - _xy[1])
+                                / _G.graph.get("vmax", 13.89))
+
+                    try:
+                        # astar_path stops as soon as the target is
+                        # popped; never swap this for a method that
+                        # expands the full graph per query
+                        path = nx.astar_path(G, cur_edge, dest_edge,
+                                             heuristic=h, weight=w)
+                    except nx.NetworkXNoPath:
+                        last_reroute[vid] = t
+                        continue
+                    _validated_set_route(vid, path, lane_id, vclass)
+                    last_reroute[vid] = t
+                continue
+
+            csr = csr_graphs.get(vclass)
+            if csr is None:
+                csr = csr_graphs[vclass] = build_routing_arrays(net, vclass)
+            if dest_edge not in csr["edge2ix"]:
+                for vid, _cur, _lane in members:
+                    last_reroute[vid] = t
+                continue
+            if csr["step"] != t:
+                # one weight refresh serves every vehicle this step
+                refresh_csr_weights(csr, tls_defs, tls_linkmap)
+                csr["step"] = t
+            group_futures.append(
+                (vclass, executor.submit(_route_group, csr, dest_edge,
+                                         members, (vclass, dest_edge), t)))
+
+        # routes are applied on the main thread: TraCI is not thread-safe
+        for vclass, fut in group_futures:
+            for vid, path, lane_id in fut.result():
+                if path is not None:
+                    _validated_set_route(vid, path, lane_id, vclass)
+                last_reroute[vid] = t
+
+        for vid in traci.simulation.getArrivedIDList():
+            if vid in depart_time:
+                tt_sum += t - depart_time.pop(vid)
+                wt_sum += waiting_time.pop(vid, 0.0)
+                n_ok += 1
+            last_reroute.pop(vid, None)
+            VCLASS_CACHE.pop(vid, None)
+
+    executor.shutdown()
+    traci.close()
+
+    n = n_ok
+    avg_travel = tt_sum / n if n else 0.0
+    avg_wait = wt_sum / n if n else 0.0
+    write_header = not os.path.exists(AGG_CSV)
+    with open(AGG_CSV, "a", newline="") as f:
+        out = csv.writer(f)
+        if write_header:
+            out.writerow(["vehicles", "avg_travel_time_s", "avg_waiting_time_s"])
+        out.writerow([n, "%.3f" % avg_travel, "%.3f" % avg_wait])
+    print("Simulation ended: %d vehicles, avg travel %.1f s, avg waiting %.1f s"
+          % (n, avg_travel, avg_wait))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,622 @@
+#!/usr/bin/env python3
+"""Dynamic rerouting without traffic-light modelling (TraCI + NetworkX).
+
+Same congestion-aware rerouting as Final2.py but with no TLS delay term,
+plus CO2/fuel accounting so the two variants can be compared on the same
+aggregate metrics.
+"""
+import os
+import sys
+import xml.etree.ElementTree as ET
+from array import array
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+if "SUMO_HOME" in os.environ:
+    sys.path.append(os.path.join(os.environ["SUMO_HOME"], "tools"))
+
+import networkx as nx
+import sumolib
+from math import hypot
+
+# libsumo runs SUMO in-process with the same API, removing the TraCI
+# socket round-trip per call; plain traci remains the fallback (and the
+# only choice for sumo-gui runs)
+try:
+    import libsumo as traci
+    import libsumo.constants as tc
+except ImportError:
+    import traci
+    import traci.constants as tc
+
+try:
+    import numpy as np
+except ImportError:  # scalar fallbacks stay available
+    np = None
+
+try:
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+except ImportError:
+    csr_matrix = None
+
+SUMO_CFG = "osm.sumocfg"
+NET_FILE = "osm.net.xml.gz"
+AGG_CSV = "aggregate_results_notls.csv"
+
+REROUTE_PERIOD = 15.0          # s between reroute attempts per vehicle
+ROUTE_COST_EPS = 0.05          # relative cost change that justifies a search
+WINDOW_N = 10                  # smoothing window for edge speed/occupancy
+OCCUPANCY_FREE_THRESH = 0.05   # below this an edge counts as free-flowing
+DENSITY_ALPHA = 2.0            # occupancy penalty factor
+SMOOTHING_MIN_SPEED = 0.5      # m/s; below this the mean speed is unreliable
+MIN_SPEED_FRACTION = 0.25      # fallback fraction of the speed limit
+
+# vehicle variables fetched in one bulk subscription result per step;
+# covers the reroute block and the per-step emission/waiting statistics
+VEH_VARS = [
+    tc.VAR_WAITING_TIME,
+    tc.VAR_ACCUMULATED_WAITING_TIME,
+    tc.VAR_CO2EMISSION,
+    tc.VAR_FUELCONSUMPTION,
+    tc.VAR_LANE_ID,
+    tc.VAR_LANEPOSITION,
+    tc.VAR_ROAD_ID,
+    tc.VAR_EDGES,
+]
+
+# rolling speed/occupancy windows per edge
+EDGE_BUF = defaultdict(lambda: {"speed": deque(maxlen=WINDOW_N),
+                                "occ": deque(maxlen=WINDOW_N)})
+
+# per-step snapshot of the edge subscription results; graph edges are
+# subscribed when their class graph is first built
+EDGE_SNAP = {}
+SUBSCRIBED_EDGES = set()
+_EMPTY = {}
+_EMPTY_SET = frozenset()
+
+# static lane topology from the parsed network; links, lengths and class
+# permissions never change during a run, so the validation helpers are
+# plain dict lookups instead of per-step TraCI calls
+LANE_OUT = {}         # lane_id -> tuple of outgoing lane ids
+LANE2EDGE = {}        # lane_id -> edge_id
+LANE_ALLOWS = {}      # (lane_id, vclass) -> bool
+_LANE_OBJ = {}        # lane_id -> sumolib lane, for lazy allows() checks
+LANE_LINK_EDGES = {}  # lane_id -> frozenset of edges its links enter
+ALLOWED_NEXT = {}     # (lane_id, vclass) -> frozenset of reachable edges
+UTURN_PARTNER = {}    # edge_id -> its opposite-direction edge id
+DRIVABLE_EDGES = frozenset()  # every non-internal edge id
+
+
+def cache_lane_topology(net):
+    """Fill the static lane tables once from the parsed network."""
+    for lane in net.getLanes():
+        lane_id = lane.getID()
+        LANE_OUT[lane_id] = tuple(c.getToLane().getID()
+                                  for c in lane.getOutgoing())
+        LANE2EDGE[lane_id] = lane.getEdge().getID()
+        _LANE_OBJ[lane_id] = lane
+    for lane_id, outs in LANE_OUT.items():
+        LANE_LINK_EDGES[lane_id] = frozenset(_lane_to_edge(o) for o in outs)
+    edge_ids = {e.getID() for e in net.getEdges(withInternal=False)}
+    for eid in edge_ids:
+        partner = eid[1:] if eid.startswith("-") else "-" + eid
+        if partner in edge_ids:
+            UTURN_PARTNER[eid] = partner
+    global DRIVABLE_EDGES
+    DRIVABLE_EDGES = frozenset(edge_ids)
+
+
+def _lane_to_edge(lane_id):
+    """Edge id of *lane_id*; string surgery only for unknown lanes."""
+    eid = LANE2EDGE.get(lane_id)
+    return eid if eid is not None else lane_id.split("_")[0]
+
+
+# a vehicle's class is immutable for its lifetime, so the two TraCI
+# calls behind it are paid once per vehicle, not twice per step
+VEH_CLASS_CACHE = {}
+
+
+def get_vehicle_class(vid):
+    """Resolve a vehicle's vClass via its type (cached per vehicle)."""
+    if vid in VEH_CLASS_CACHE:
+        return VEH_CLASS_CACHE[vid]
+    try:
+        type_id = traci.vehicle.getTypeID(vid)
+        vclass = traci.vehicletype.getVehicleClass(type_id)
+    except traci.TraCIException:
+        vclass = None
+    VEH_CLASS_CACHE[vid] = vclass
+    return vclass
+
+
+def _safe_iter_out_lanes(lane_id):
+    """Outgoing lane ids of *lane_id*, () for unknown lanes."""
+    return LANE_OUT.get(lane_id, ())
+
+
+def _lane_allows_class(lane_id, vclass):
+    """Whether *lane_id* permits vehicles of *vclass*."""
+    if vclass is None:
+        return True
+    key = (lane_id, vclass)
+    hit = LANE_ALLOWS.get(key)
+    if hit is None:
+        lane = _LANE_OBJ.get(lane_id)
+        hit = LANE_ALLOWS[key] = lane is None or lane.allows(vclass)
+    return hit
+
+
+def is_uturn_pair(a, b):
+    return b == UTURN_PARTNER.get(a)
+
+
+def next_edges_allowed_from_current_lane(lane_id, vclass):
+    """Edges reachable from *lane_id* for vehicles of *vclass* (cached)."""
+    key = (lane_id, vclass)
+    hit = ALLOWED_NEXT.get(key)
+    if hit is None:
+        hit = ALLOWED_NEXT[key] = frozenset(
+            _lane_to_edge(out_lane)
+            for out_lane in _safe_iter_out_lanes(lane_id)
+            if _lane_allows_class(out_lane, vclass))
+    return hit
+
+
+def lane_has_link_to_edge(lane_id, eid):
+    """True if *lane_id* has a link into edge *eid*."""
+    return eid in LANE_LINK_EDGES.get(lane_id, _EMPTY_SET)
+
+
+def build_edge_graph_from_net(net, vclass):
+    """Edge-as-node graph for one vehicle class, built from the parsed net.
+
+    Topology, lengths, speed limits and permissions are static, so the
+    graph is a pure function of the network file — no TraCI interrogation
+    and built exactly once per class; only the edge weights are dynamic.
+    """
+    G = nx.DiGraph()
+    for edge in net.getEdges(withInternal=False):
+        if vclass is not None and not edge.allows(vclass):
+            continue
+        fx, fy = edge.getFromNode().getCoord()
+        tx, ty = edge.getToNode().getCoord()
+        G.add_node(edge.getID(),
+                   length=edge.getLength(),
+                   speed_limit=edge.getSpeed(),
+                   xy=((fx + tx) / 2.0, (fy + ty) / 2.0))
+    for edge in net.getEdges(withInternal=False):
+        eid = edge.getID()
+        if eid not in G:
+            continue
+        for succ in edge.getOutgoing():
+            out_id = succ.getID()
+            if out_id in G and not is_uturn_pair(eid, out_id):
+                G.add_edge(eid, out_id)
+    for eid in G.nodes:
+        if eid not in SUBSCRIBED_EDGES:
+            traci.edge.subscribe(eid, [tc.LAST_STEP_OCCUPANCY,
+                                       tc.LAST_STEP_MEAN_SPEED])
+            SUBSCRIBED_EDGES.add(eid)
+    # SoA mirror of the static node attributes for the vectorized
+    # weight recompute
+    order = list(G.nodes)
+    G.graph["order"] = order
+    G.graph["max_limit"] = max(
+        (G.nodes[e].get("speed_limit", 13.89) for e in order), default=13.89)
+    if np is not None:
+        G.graph["ix"] = {eid: i for i, eid in enumerate(order)}
+        G.graph["length"] = np.array(
+            [G.nodes[e].get("length", 1.0) for e in order])
+        G.graph["speed_limit"] = np.array(
+            [G.nodes[e].get("speed_limit", 13.89) for e in order])
+        # rolling speed/occupancy windows for every edge at once: one
+        # ring-buffer column write plus one mean per step instead of
+        # |edges| deque updates
+        n = len(order)
+        G.graph["speed_ring"] = np.zeros((n, WINDOW_N), dtype=np.float32)
+        G.graph["occ_ring"] = np.zeros((n, WINDOW_N), dtype=np.float32)
+        G.graph["ring_head"] = 0
+        G.graph["ring_cnt"] = 0
+    # reversed CSR adjacency for destination-rooted shortest-path trees;
+    # the sparsity pattern is static, only the data vector changes
+    if np is not None and csr_matrix is not None and G.number_of_edges():
+        ix = G.graph["ix"]
+        rows = np.array([ix[v] for _, v in G.edges])
+        cols = np.array([ix[u] for u, _ in G.edges])
+        n = len(order)
+        rev = csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+        G.graph["rev"] = rev
+        # entry k of rev sits in row r == the original edge being entered,
+        # so rev.data = wvec[rev_row] refreshes all weights at once
+        G.graph["rev_row"] = np.repeat(np.arange(n), np.diff(rev.indptr))
+    return G
+
+
+def expected_speed(eid, speed_limit):
+    """Smoothed effective speed and occupancy on *eid*.
+
+    Reads from the per-step subscription snapshot; edges missing from it
+    (first step after subscribing) count as free-flowing.
+    """
+    state = EDGE_SNAP.get(eid)
+    if state is None:
+        occ, mean_speed = 0.0, -1.0
+    else:
+        occ = state.get(tc.LAST_STEP_OCCUPANCY, 0.0)
+        mean_speed = state.get(tc.LAST_STEP_MEAN_SPEED, -1.0)
+    buf = EDGE_BUF[eid]
+    buf["speed"].append(mean_speed if mean_speed >= 0 else speed_limit)
+    buf["occ"].append(occ)
+    sm_speed = sum(buf["speed"]) / len(buf["speed"])
+    sm_occ = sum(buf["occ"]) / len(buf["occ"])
+    if sm_occ < OCCUPANCY_FREE_THRESH:
+        return speed_limit, sm_occ
+    if sm_speed > SMOOTHING_MIN_SPEED:
+        return sm_speed, sm_occ
+    return speed_limit * MIN_SPEED_FRACTION, sm_occ
+
+
+def compute_edge_weights_for_class(G):
+    """Refresh the "w" attribute of every movement from current traffic.
+
+    With NumPy the whole cost formula runs as array expressions over the
+    SoA mirror instead of per-node dict lookups; the flat weight vector
+    is also kept on the graph for array-based routing.
+    """
+    if np is not None:
+        order = G.graph["order"]
+        n = len(order)
+        occ = np.fromiter(
+            (EDGE_SNAP.get(e, _EMPTY).get(tc.LAST_STEP_OCCUPANCY, 0.0)
+             for e in order), dtype=np.float64, count=n)
+        spd = np.fromiter(
+            (EDGE_SNAP.get(e, _EMPTY).get(tc.LAST_STEP_MEAN_SPEED, -1.0)
+             for e in order), dtype=np.float64, count=n)
+        limits = G.graph["speed_limit"]
+        spd = np.where(spd < 0.0, limits, spd)
+        speed_ring = G.graph["speed_ring"]
+        occ_ring = G.graph["occ_ring"]
+        head = G.graph["ring_head"]
+        speed_ring[:, head] = spd
+        occ_ring[:, head] = occ
+        G.graph["ring_head"] = (head + 1) % WINDOW_N
+        cnt = min(G.graph["ring_cnt"] + 1, WINDOW_N)
+        G.graph["ring_cnt"] = cnt
+        sm_spd = speed_ring[:, :cnt].sum(axis=1) / cnt
+        sm_occ = occ_ring[:, :cnt].sum(axis=1) / cnt
+        use = np.where(sm_occ < OCCUPANCY_FREE_THRESH, limits,
+                       np.where(sm_spd > SMOOTHING_MIN_SPEED, sm_spd,
+                                limits * MIN_SPEED_FRACTION))
+        wvec = (G.graph["length"] / np.maximum(use, 0.1)
+                * (1.0 + DENSITY_ALPHA * sm_occ))
+        G.graph["wvec"] = wvec
+        # weights live only in the flat vector (and the CSR data view
+        # derived from it); routing reads them by index, so no per-edge
+        # dict write into the NetworkX adjacency is needed
+        rev = G.graph.get("rev")
+        if rev is not None:
+            rev.data = wvec[G.graph["rev_row"]]
+        return
+    for eid in G.nodes:
+        nd = G.nodes[eid]
+        speed_limit = nd.get("speed_limit", 13.89)
+        use_speed, sm_occ = expected_speed(eid, speed_limit)
+        nd["cost"] = (nd.get("length", 1.0) / max(use_speed, 0.1)
+                      * (1.0 + DENSITY_ALPHA * sm_occ))
+    for u, v in G.edges:
+        G.edges[u, v]["w"] = G.nodes[v]["cost"]
+
+
+def _astar_path(G, src, dest_edge):
+    """Single source-destination search with a travel-time lower bound.
+
+    Straight-line distance divided by the network's top speed limit is
+    admissible for the "w" cost, so A* pops far fewer nodes than a full
+    Dijkstra sweep when only one query is needed.
+    """
+    dx, dy = G.nodes[dest_edge]["xy"]
+    vmax = G.graph["max_limit"]
+
+    def h(u, _v):
+        x, y = G.nodes[u]["xy"]
+        return hypot(x - dx, y - dy) / vmax
+
+    wvec = G.graph.get("wvec")
+    if wvec is not None:
+        ix = G.graph["ix"]
+        weight = lambda u, v, d: wvec[ix[v]]
+    else:
+        weight = "w"
+    try:
+        return nx.astar_path(G, src, dest_edge, heuristic=h, weight=weight)
+    except nx.NetworkXNoPath:
+        return None
+
+
+class VehicleStats:
+    """Per-vehicle accounting in four parallel arrays.
+
+    Rows are compact integer slots handed out on departure and recycled
+    on arrival, so the per-step updates and the arrival accumulation are
+    array indexing instead of one four-entry dict per vehicle.
+    """
+
+    FIELDS = ("depart", "wait", "co2", "fuel")
+
+    def __init__(self, cap=1024):
+        self.slot = {}  # vid -> row
+        self.free = []  # recycled rows
+        self.n = 0
+        for name in self.FIELDS:
+            setattr(self, name,
+                    np.zeros(cap) if np is not None else array("d"))
+
+    def add(self, vid, depart_time):
+        """Claim a row for *vid* and reset its accumulators."""
+        if self.free:
+            i = self.free.pop()
+        else:
+            i = self.n
+            self.n += 1
+            if np is not None:
+                if i >= self.depart.shape[0]:
+                    for name in self.FIELDS:
+                        old = getattr(self, name)
+                        new = np.zeros(old.shape[0] * 2)
+                        new[:old.shape[0]] = old
+                        setattr(self, name, new)
+            else:
+                for name in self.FIELDS:
+                    getattr(self, name).append(0.0)
+        self.depart[i] = depart_time
+        self.wait[i] = self.co2[i] = self.fuel[i] = 0.0
+        self.slot[vid] = i
+        return i
+
+    def pop(self, vid):
+        """Release *vid*'s row; returns (depart, wait, co2, fuel)."""
+        i = self.slot.pop(vid, None)
+        if i is None:
+            return None
+        self.free.append(i)
+        return self.depart[i], self.wait[i], self.co2[i], self.fuel[i]
+
+
+def route_file_vclasses(cfg_path):
+    """Vehicle classes declared by the route files of *cfg_path*.
+
+    Lets every per-class graph be built up front; trips without an
+    explicit vType run as the default passenger class.
+    """
+    classes = set()
+    try:
+        cfg = ET.parse(cfg_path).getroot()
+    except (ET.ParseError, OSError):
+        return classes
+    files = ",".join(opt.get("value", "") for opt in cfg.iter("route-files"))
+    base = os.path.dirname(cfg_path)
+    for fname in filter(None, (f.strip() for f in files.split(","))):
+        try:
+            root = ET.parse(os.path.join(base, fname)).getroot()
+        except (ET.ParseError, OSError):
+            continue
+        for vtype in root.iter("vType"):
+            classes.add(vtype.get("vClass", "passenger"))
+        if root.find("trip") is not None or root.find("vehicle") is not None:
+            classes.add("passenger")
+    return classes
+
+
+def route_cost(G, route):
+    """Current cost of *route* under the freshly computed weights."""
+    wvec = G.graph.get("wvec")
+    if wvec is not None:
+        ix = G.graph["ix"]
+        return sum(wvec[i] for i in (ix.get(e) for e in route)
+                   if i is not None)
+    return sum(G.nodes[e].get("cost", 0.0) for e in route if e in G)
+
+
+def shortest_paths_to_dest(G, dest_edge, sources):
+    """Paths from each of *sources* to *dest_edge*, as {source: path}.
+
+    Singleton queries use the goal-directed A* search; larger groups are
+    answered by a single shortest-path tree rooted at the destination on
+    the reversed graph (one native-code sweep with SciPy). Without SciPy
+    each source falls back to its own NetworkX search.
+    """
+    out = {}
+    uniq = set(sources)
+    if len(uniq) == 1:
+        src = next(iter(uniq))
+        if src in G:
+            path = _astar_path(G, src, dest_edge)
+            if path:
+                out[src] = path
+        return out
+    rev = G.graph.get("rev")
+    if rev is not None:
+        ix = G.graph["ix"]
+        order = G.graph["order"]
+        dist, preds = csgraph_dijkstra(rev, directed=True,
+                                       indices=ix[dest_edge],
+                                       return_predecessors=True)
+        for src in uniq:
+            i = ix.get(src)
+            if i is None or not np.isfinite(dist[i]):
+                continue
+            # walking the reversed-tree predecessors from the source
+            # yields the forward path toward the destination
+            path = [src]
+            while order[i] != dest_edge:
+                i = preds[i]
+                path.append(order[i])
+            out[src] = path
+        return out
+    for src in uniq:
+        if src not in G:
+            continue
+        path = _astar_path(G, src, dest_edge)
+        if path:
+            out[src] = path
+    return out
+
+
+def main():
+    net = sumolib.net.readNet(NET_FILE)
+    cache_lane_topology(net)
+    traci.start([sumolib.checkBinary("sumo"), "-c", SUMO_CFG])
+    # the step length is a simulation constant; fetch it once
+    try:
+        step_sec = traci.simulation.getDeltaT()
+    except traci.TraCIException:
+        step_sec = 1.0
+
+    # the class graphs are pure functions of the static net, so build
+    # every one up front instead of lazily inside the vehicle loop
+    edge_graph_cache = {}  # vclass -> nx.DiGraph
+    for vclass in route_file_vclasses(SUMO_CFG) or {None}:
+        edge_graph_cache[vclass] = build_edge_graph_from_net(net, vclass)
+    executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+    stats = VehicleStats()
+    last_reroute = {}     # vid -> time of the last search
+    last_route_cost = {}  # vid -> route cost at that search
+    total_travel = total_wait = total_co2 = total_fuel = 0.0
+    n_finished = 0
+
+    while traci.simulation.getMinExpectedNumber() > 0:
+        traci.simulationStep()
+        t = traci.simulation.getTime()
+
+        # step 1: register newly departed vehicles; the subscription set
+        # is the active set, maintained O(departed+arrived) per step
+        # because SUMO drops a vehicle's subscription on arrival
+        for vid in traci.simulation.getDepartedIDList():
+            stats.add(vid, t)
+            traci.vehicle.subscribe(vid, VEH_VARS)
+
+        # one bulk read refreshes every edge's dynamic state for step 3
+        EDGE_SNAP.clear()
+        EDGE_SNAP.update(traci.edge.getAllSubscriptionResults())
+
+        # step 2: one pass over the bulk snapshot updates the per-vehicle
+        # statistics and collects the reroute candidates
+        veh_snap = traci.vehicle.getAllSubscriptionResults()
+        reroute_groups = defaultdict(list)
+        slot = stats.slot
+        wait_arr, co2_arr, fuel_arr = stats.wait, stats.co2, stats.fuel
+        for vid, snap in veh_snap.items():
+            row = slot.get(vid)
+            if row is not None:
+                wait_arr[row] = snap.get(tc.VAR_ACCUMULATED_WAITING_TIME, 0.0)
+                co2_arr[row] += snap.get(tc.VAR_CO2EMISSION, 0.0) * step_sec
+                fuel_arr[row] += snap.get(tc.VAR_FUELCONSUMPTION,
+                                          0.0) * step_sec
+            cur_edge = snap.get(tc.VAR_ROAD_ID, "")
+            route = snap.get(tc.VAR_EDGES) or ()
+            # one hash probe replaces the startswith(":") scans and also
+            # rejects empty/unknown edge ids
+            if cur_edge not in DRIVABLE_EDGES or not route:
+                continue
+            dest_edge = route[-1]
+            if dest_edge not in DRIVABLE_EDGES or cur_edge == dest_edge:
+                continue
+            if t - last_reroute.get(vid, -REROUTE_PERIOD) < REROUTE_PERIOD:
+                continue
+            vclass = get_vehicle_class(vid)
+            reroute_groups[(vclass, dest_edge)].append(
+                (vid, cur_edge, snap.get(tc.VAR_LANE_ID, ""), route))
+
+        # step 3: reroute on the smoothed congestion graph; vehicles
+        # sharing a destination (and class) are answered by one
+        # shortest-path tree instead of one search each. The trees run
+        # on the pool — SciPy's dijkstra releases the GIL — while route
+        # application (TraCI) stays on the main thread.
+        recomputed = set()
+        group_futures = []
+        for (vclass, dest_edge), members in reroute_groups.items():
+            G = edge_graph_cache.get(vclass)
+            if G is None:  # class not declared in the route files
+                G = edge_graph_cache[vclass] = build_edge_graph_from_net(
+                    net, vclass)
+            if vclass not in recomputed:
+                compute_edge_weights_for_class(G)
+                recomputed.add(vclass)
+            if dest_edge not in G:
+                continue
+            # skip vehicles whose current route costs about the same as
+            # when it was last computed — the search result won't change
+            due = []
+            for vid, cur_edge, lane_id, route in members:
+                cost = route_cost(G, route)
+                prev_cost = last_route_cost.get(vid)
+                if (prev_cost is not None and prev_cost > 0.0
+                        and abs(cost - prev_cost) / prev_cost
+                        < ROUTE_COST_EPS):
+                    continue
+                last_reroute[vid] = t
+                last_route_cost[vid] = cost
+                due.append((vid, cur_edge, lane_id))
+            if not due:
+                continue
+            group_futures.append(
+                (vclass, due,
+                 executor.submit(shortest_paths_to_dest, G, dest_edge,
+                                 [m[1] for m in due])))
+
+        for vclass, due, future in group_futures:
+            paths = future.result()
+            for vid, cur_edge, lane_id in due:
+                path = paths.get(cur_edge)
+                if not path:
+                    continue
+                if len(path) > 1:
+                    allowed_next = next_edges_allowed_from_current_lane(
+                        lane_id, vclass)
+                    if allowed_next and path[1] not in allowed_next:
+                        continue
+                    if is_uturn_pair(path[0], path[1]):
+                        continue
+                    if lane_id and not lane_has_link_to_edge(lane_id, path[1]):
+                        continue
+                try:
+                    traci.vehicle.setRoute(vid, path)
+                except traci.TraCIException:
+                    pass
+
+        # step 4: account arrived vehicles
+        for vid in traci.simulation.getArrivedIDList():
+            VEH_CLASS_CACHE.pop(vid, None)
+            last_reroute.pop(vid, None)
+            last_route_cost.pop(vid, None)
+            rec = stats.pop(vid)
+            if rec is None:
+                continue
+            depart, wait, co2, fuel = rec
+            total_travel += t - depart
+            total_wait += wait
+            total_co2 += co2
+            total_fuel += fuel
+            n_finished += 1
+
+    executor.shutdown()
+    traci.close()
+
+    avg_travel = total_travel / n_finished if n_finished else 0.0
+    avg_wait = total_wait / n_finished if n_finished else 0.0
+    write_header = not os.path.exists(AGG_CSV)
+    with open(AGG_CSV, "a") as f:
+        if write_header:
+            f.write("vehicles,avg_travel_time_s,avg_waiting_time_s,"
+                    "total_co2_g,total_fuel_l\n")
+        f.write(f"{n_finished},{avg_travel:.3f},{avg_wait:.3f},"
+                f"{total_co2 / 1000.0:.3f},{total_fuel / 1000.0:.3f}\n")
+    print("Simulation ended: %d vehicles, avg travel %.1f s, avg waiting %.1f s"
+          % (n_finished, avg_travel, avg_wait))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""Single-source shortest paths over a junction graph.
+
+Used by the baseline comparison scripts: the graph is a dict-of-dicts
+``{from_junction: {to_junction: travel_time}}`` and vertices are SUMO
+junction ids.
+"""
+import heapq
+
+try:
+    import numpy as np
+except ImportError:  # plain-list labels stay available
+    np = None
+
+try:
+    from numba import njit
+except ImportError:  # fall back to the interpreted relaxation loop
+    njit = None
+if np is None:
+    njit = None
+
+INFINITY = float("inf")
+
+
+if njit is not None:
+    @njit(cache=True)
+    def _sssp_kernel(indptr, indices, weights, src, allowed,
+                     dist, prev, done, heap_d, heap_v):
+        """Dijkstra relaxation loop compiled to native code.
+
+        Hand-rolled binary heap (numba does not lift heapq) working
+        entirely on caller-provided buffers, so repeated reroute calls
+        allocate nothing.
+        """
+        n = indptr.shape[0] - 1
+        for i in range(n):
+            dist[i] = np.inf
+            prev[i] = -1
+            done[i] = 0
+
+        dist[src] = 0.0
+        heap_d[0] = 0.0
+        heap_v[0] = src
+        size = 1
+        while size > 0:
+            u = heap_v[0]
+            # pop-min: sift the last element down from the root
+            size -= 1
+            d = heap_d[size]
+            v0 = heap_v[size]
+            i = 0
+            while True:
+                c = 2 * i + 1
+                if c >= size:
+                    break
+                if c + 1 < size and heap_d[c + 1] < heap_d[c]:
+                    c += 1
+                if heap_d[c] >= d:
+                    break
+                heap_d[i] = heap_d[c]
+                heap_v[i] = heap_v[c]
+                i = c
+            heap_d[i] = d
+            heap_v[i] = v0
+
+            if done[u]:
+                continue
+            done[u] = 1
+            du = dist[u]
+            for k in range(indptr[u], indptr[u + 1]):
+                v = indices[k]
+                if done[v] or not allowed[v]:
+                    continue
+                alt = du + weights[k]
+                if alt < dist[v]:
+                    dist[v] = alt
+                    prev[v] = u
+                    # push with sift-up
+                    i = size
+                    size += 1
+                    while i > 0:
+                        p = (i - 1) // 2
+                        if heap_d[p] <= alt:
+                            break
+                        heap_d[i] = heap_d[p]
+                        heap_v[i] = heap_v[p]
+                        i = p
+                    heap_d[i] = alt
+                    heap_v[i] = v
+
+    # scratch buffers per (n, m) shape, reused across calls
+    _SSSP_SCRATCH = {}
+
+    def sssp(indptr, indices, weights, src, dist=None, prev=None,
+             allowed=None):
+        """Run the jitted kernel, reusing shape-matched scratch buffers.
+
+        *allowed* restricts expansion to nodes with a nonzero mask entry
+        (the source is always expanded). The returned dist/prev arrays
+        are overwritten by the next call with the same graph shape
+        unless the caller passes its own.
+        """
+        n = indptr.shape[0] - 1
+        m = indices.shape[0]
+        buf = _SSSP_SCRATCH.get((n, m))
+        if buf is None:
+            buf = _SSSP_SCRATCH[(n, m)] = (
+                np.empty(n), np.empty(n, np.int32), np.empty(n, np.uint8),
+                np.empty(m + 2), np.empty(m + 2, np.int32),
+                np.ones(n, np.uint8))
+        s_dist, s_prev, done, heap_d, heap_v, all_ones = buf
+        if dist is None:
+            dist = s_dist
+        if prev is None:
+            prev = s_prev
+        if allowed is None:
+            allowed = all_ones
+        _sssp_kernel(indptr, indices, weights, src, allowed,
+                     dist, prev, done, heap_d, heap_v)
+        return dist, prev
+else:
+    sssp = None
+
+
+class Dijkstra:
+    """Shortest-path labels from *start* over *graph*.
+
+    Uses a binary heap with lazy deletion, O((V+E) log V): stale heap
+    entries are skipped when popped instead of being removed eagerly,
+    so no decrease-key operation is needed.
+
+    Vertices are mapped to contiguous integer ids once and the graph is
+    flattened to CSR arrays (indptr, indices, weights), so the whole
+    relaxation loop runs over flat arrays — JIT-compiled to native code
+    when numba is available, interpreted otherwise.
+    """
+
+    def __init__(self, graph, start):
+        self.graph = graph
+        self.start = start
+        self.vertices = list(graph)
+        self.index = {v: i for i, v in enumerate(self.vertices)}
+        n = len(self.vertices)
+        if np is not None:
+            index = self.index
+            indptr = np.empty(n + 1, dtype=np.int32)
+            indices = []
+            weights = []
+            indptr[0] = 0
+            for i, v in enumerate(self.vertices):
+                for nbr, w in graph[v].items():
+                    j = index.get(nbr)
+                    if j is not None:
+                        indices.append(j)
+                        weights.append(w)
+                indptr[i + 1] = len(indices)
+            self.indptr = indptr
+            self.indices = np.array(indices, dtype=np.int32)
+            self.weights = np.array(weights, dtype=np.float64)
+            self.dist = np.full(n, INFINITY)
+            self.prev = np.full(n, -1, dtype=np.int32)
+        else:
+            self.dist = [INFINITY] * n
+            self.prev = [-1] * n
+
+    @classmethod
+    def from_csr(cls, indptr, indices, weights, vertices, index, start):
+        """Wrap prebuilt CSR arrays, skipping the dict-graph flattening.
+
+        Callers that maintain their own indptr/indices/weights (with
+        *vertices* and *index* mapping ids to rows) reuse those arrays
+        directly; requires NumPy.
+        """
+        self = cls.__new__(cls)
+        self.graph = None
+        self.start = start
+        self.vertices = vertices
+        self.index = index
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        n = len(vertices)
+        self.dist = np.full(n, INFINITY)
+        self.prev = np.full(n, -1, dtype=np.int32)
+        return self
+
+    def distance(self, vertex):
+        """Settled distance of *vertex*, inf if unreachable/unknown."""
+        i = self.index.get(vertex)
+        return INFINITY if i is None else self.dist[i]
+
+    def dijkstra(self):
+        """Settle every vertex reachable from the start."""
+        src = self.index.get(self.start)
+        if src is None:
+            return
+        if sssp is not None:
+            sssp(self.indptr, self.indices, self.weights, src,
+                 self.dist, self.prev)
+            return
+        dist, prev = self.dist, self.prev
+        dist[src] = 0.0
+        pq = [(0.0, src)]
+        if np is not None:
+            indptr, indices, weights = (self.indptr, self.indices,
+                                        self.weights)
+            while pq:
+                d, u = heapq.heappop(pq)
+                if d > dist[u]:
+                    continue  # stale entry, already settled cheaper
+                for k in range(indptr[u], indptr[u + 1]):
+                    i = indices[k]
+                    alt = d + weights[k]
+                    if alt < dist[i]:
+                        dist[i] = alt
+                        prev[i] = u
+                        heapq.heappush(pq, (alt, int(i)))
+            return
+        index, vertices = self.index, self.vertices
+        while pq:
+            d, u = heapq.heappop(pq)
+            if d > dist[u]:
+                continue  # stale entry, already settled cheaper
+            for nbr, w in self.graph[vertices[u]].items():
+                i = index.get(nbr)
+                if i is None:
+                    continue
+                alt = d + w
+                if alt < dist[i]:
+                    dist[i] = alt
+                    prev[i] = u
+                    heapq.heappush(pq, (alt, i))
+
+    def build_path(self, dest):
+        """Vertex list from the start to *dest*, or None if unreachable."""
+        i = self.index.get(dest)
+        if i is None or self.dist[i] == INFINITY:
+            return None
+        path = [self.vertices[i]]
+        while self.prev[i] >= 0:
+            i = self.prev[i]
+            path.append(self.vertices[i])
+        path.reverse()
+        return path if path[0] == self.start else None
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Static-routing baseline: vehicles keep their original routes.
+
+Collects the same aggregate metrics as run_dijkstra.py so the learned
+rerouting can be compared against SUMO's precomputed routes.
+"""
+import os
+import sys
+
+if "SUMO_HOME" in os.environ:
+    sys.path.append(os.path.join(os.environ["SUMO_HOME"], "tools"))
+
+import sumolib
+import traci
+import traci.constants as tc
+
+SUMO_CFG = "osm.sumocfg"
+AGG_CSV = "aggregate_results_static.csv"
+
+VEH_VARS = (tc.VAR_CO2EMISSION, tc.VAR_ACCUMULATED_WAITING_TIME)
+SIM_VARS = (tc.VAR_TIME, tc.VAR_DEPARTED_VEHICLES_IDS,
+            tc.VAR_ARRIVED_VEHICLES_IDS)
+
+
+def run_simulation():
+    traci.start([sumolib.checkBinary("sumo"), "-c", SUMO_CFG])
+    step_sec = traci.simulation.getDeltaT()
+    traci.simulation.subscribe(SIM_VARS)
+
+    vehicle_states = {}
+    total_travel = total_wait = total_co2 = 0.0
+    n_finished = 0
+
+    while traci.simulation.getMinExpectedNumber() > 0:
+        traci.simulationStep()
+        sim_sub = traci.simulation.getSubscriptionResults()
+        sim_time = sim_sub.get(tc.VAR_TIME, 0.0)
+
+        for vid in sim_sub.get(tc.VAR_DEPARTED_VEHICLES_IDS) or ():
+            vehicle_states[vid] = {"depart": sim_time, "co2_mg": 0.0,
+                                   "waiting_time": 0.0}
+            traci.vehicle.subscribe(vid, VEH_VARS)
+
+        for vid, d in traci.vehicle.getAllSubscriptionResults().items():
+            st = vehicle_states.get(vid)
+            if st is None:
+                continue
+            st["co2_mg"] += d.get(tc.VAR_CO2EMISSION, 0.0) * step_sec
+            st["waiting_time"] = d.get(tc.VAR_ACCUMULATED_WAITING_TIME, 0.0)
+
+        for vid in sim_sub.get(tc.VAR_ARRIVED_VEHICLES_IDS) or ():
+            st = vehicle_states.pop(vid, None)
+            if st is None:
+                continue
+            total_travel += sim_time - st["depart"]
+            total_wait += st["waiting_time"]
+            total_co2 += st["co2_mg"]
+            n_finished += 1
+
+    traci.close()
+
+    avg_travel = total_travel / n_finished if n_finished else 0.0
+    avg_wait = total_wait / n_finished if n_finished else 0.0
+    write_header = not os.path.exists(AGG_CSV)
+    with open(AGG_CSV, "a") as f:
+        if write_header:
+            f.write("vehicles,avg_travel_time_s,avg_waiting_time_s,"
+                    "total_co2_g\n")
+        f.write(f"{n_finished},{avg_travel:.3f},{avg_wait:.3f},"
+                f"{total_co2 / 1000.0:.3f}\n")
+    print("Simulation ended: %d vehicles, avg travel %.1f s, avg waiting %.1f s"
+          % (n_finished, avg_travel, avg_wait))
+
+
+if __name__ == "__main__":
+    run_simulation()
@@ -0,0 +1,892 @@
+#!/usr/bin/env python3
+"""Adaptive Dijkstra rerouting on a junction graph (TraCI + sumolib).
+
+Learns per-movement travel times while the simulation runs and reroutes
+vehicles over a junction graph weighted with the measured averages;
+compared against the static baseline in run.py.
+"""
+import os
+import sys
+import csv
+import heapq
+import pickle
+import logging
+from collections import OrderedDict, deque
+from math import hypot
+
+if "SUMO_HOME" in os.environ:
+    sys.path.append(os.path.join(os.environ["SUMO_HOME"], "tools"))
+
+import sumolib
+import traci
+import traci.constants as tc
+
+# sssp is None when numba is unavailable; the interpreted searches
+# below remain as the fallback
+from dijkstra import Dijkstra, sssp
+
+try:
+    import numpy as np
+except ImportError:  # dict-graph Dijkstra stays available
+    np = None
+
+SUMO_CFG = "osm.sumocfg"
+NET_FILE = "osm.net.xml.gz"
+GRAPH_CSV = "junction_graph.csv"
+GRAPH_NPZ = "junction_graph.npz"
+NET_CACHE = "net.cache.pkl"
+AGG_CSV = "aggregate_results_dijkstra.csv"
+
+# --csv keeps the human-readable graph dump instead of the binary one
+USE_CSV_GRAPH = "--csv" in sys.argv
+
+log = logging.getLogger(__name__)
+
+REROUTE_MIN_INTERVAL = 30.0  # s between reroute attempts per vehicle
+STATS_WINDOW = 5             # samples in the per-movement moving average
+
+# vehicle variables fetched in one bulk subscription result per step
+VEH_VARS = (tc.VAR_ROAD_ID, tc.VAR_CO2EMISSION,
+            tc.VAR_ACCUMULATED_WAITING_TIME, tc.VAR_EDGES)
+SIM_VARS = (tc.VAR_TIME, tc.VAR_DEPARTED_VEHICLES_IDS,
+            tc.VAR_ARRIVED_VEHICLES_IDS,
+            tc.VAR_TELEPORT_ENDING_VEHICLES_IDS)
+
+net = None
+edge_to_junction = {}  # edge_id -> (from_junction, to_junction)
+junc_out_edges = {}    # from_j -> {to_j: fastest connecting edge id}
+node_coords = {}       # junction id -> (x, y)
+edge_max_speed = {}    # edge id -> fastest lane speed
+edge_freeflow = {}     # edge id -> length / fastest lane speed
+
+# learned travel times: junction_graph[from_j][to_j] = seconds
+junction_graph = {}
+# routing topology after degree-2 chain contraction, plus the tables to
+# expand contracted hops back and to keep their summed weights current
+contracted_graph = {}
+expansion_map = {}   # (u, w) -> full junction sequence u..w
+pair_to_chain = {}   # member pair -> its contracted (u, w)
+# interned edge index -> [recent-samples deque, running sum]; the
+# average is maintained incrementally instead of slicing and re-summing
+# per update
+junction_stats = {}
+# vid -> departure time and reroute bookkeeping
+vehicle_states = {}
+
+# per-vehicle accumulators in parallel arrays indexed by compact slots
+# (veh_slot), so the per-step update is a handful of vectorized ops
+# instead of three dict writes per vehicle; slots are recycled on arrival
+veh_slot = {}
+_free_slots = []
+_next_slot = 0
+if np is not None:
+    co2_arr = np.zeros(1024)
+    wait_arr = np.zeros(1024)
+    last_wait_arr = np.zeros(1024)
+
+
+def _claim_slot(vid):
+    """Hand *vid* a zeroed accumulator row, growing geometrically."""
+    global _next_slot, co2_arr, wait_arr, last_wait_arr
+    if _free_slots:
+        i = _free_slots.pop()
+    else:
+        i = _next_slot
+        _next_slot += 1
+        if i >= co2_arr.shape[0]:
+            for name in ("co2_arr", "wait_arr", "last_wait_arr"):
+                old = globals()[name]
+                new = np.zeros(old.shape[0] * 2)
+                new[:old.shape[0]] = old
+                globals()[name] = new
+    co2_arr[i] = wait_arr[i] = last_wait_arr[i] = 0.0
+    veh_slot[vid] = i
+
+# CSR mirror of junction_graph with contiguous integer junction ids;
+# the topology is static, only csr_weights is maintained in place
+junc_list = []    # row -> junction id
+junc_index = {}   # junction id -> row
+edge_slot = {}    # (from_row, to_row) -> position in csr_weights
+
+# interned edge ids: the per-step hot paths translate the TraCI edge
+# string once via edge_index and index these parallel tables instead of
+# hashing id strings on every lookup
+edge_index = {}       # edge id -> compact int
+edge_from_j = []      # edge -> from-junction id (for the learned dicts)
+edge_to_j = []        # edge -> to-junction id
+edge_row_from = None  # edge -> routing row of its from junction, -1 if cut
+edge_row_to = None    # edge -> routing row of its to junction, -1 if cut
+edge_wslot = None     # edge -> position in csr_weights, -1 if none
+edge_chain = []       # edge -> contracted chain covering it, or None
+edge_ff = []          # edge -> free-flow traversal time
+csr_indptr = None
+csr_indices = None
+csr_weights = None
+rev_indptr = None
+rev_indices = None
+rev_wslot = None  # reverse entry -> forward weight position
+node_xy = None    # row -> junction coordinates, for the A* potentials
+max_net_speed = 13.89  # fastest edge in the net, admissible divisor
+
+# many vehicles share OD pairs, so completed searches are reused while
+# the learned weights have not changed meaningfully since they ran
+PATH_CACHE_MAX = 4096
+EPOCH_BUMP_REL = 0.10  # relative weight change that invalidates paths
+path_cache = OrderedDict()  # (src_row, dst_row) -> (epoch, junction path)
+graph_epoch = 0
+
+
+def contract_junction_chains():
+    """Collapse degree-2 junction chains into single routing edges.
+
+    Interior junctions offer no routing alternative, so removing them
+    shrinks the search graph without changing any shortest path. The
+    expansion map records the full junction sequence of every combined
+    edge so paths are expanded back before being turned into SUMO edges.
+    """
+    g = {u: dict(nbrs) for u, nbrs in junction_graph.items()}
+    preds = {u: set() for u in g}
+    for u, nbrs in g.items():
+        for v in nbrs:
+            preds.setdefault(v, set()).add(u)
+    seq = {}
+    changed = True
+    while changed:
+        changed = False
+        for v in list(g):
+            nbrs = g.get(v)
+            if nbrs is None or len(nbrs) != 1:
+                continue
+            pv = preds.get(v)
+            if pv is None or len(pv) != 1:
+                continue
+            u = next(iter(pv))
+            w = next(iter(nbrs))
+            if u == v or v == w or u == w or v not in g.get(u, _EMPTY):
+                continue
+            wgt = g[u][v] + g[v][w]
+            left = seq.pop((u, v), None) or [u, v]
+            right = seq.pop((v, w), None) or [v, w]
+            del g[u][v]
+            del g[v]
+            preds[w].discard(v)
+            del preds[v]
+            existing = g[u].get(w)
+            if existing is None or wgt < existing:
+                g[u][w] = wgt
+                seq[(u, w)] = left + right[1:]
+                preds[w].add(u)
+            changed = True
+    contracted_graph.clear()
+    contracted_graph.update(g)
+    expansion_map.clear()
+    expansion_map.update(seq)
+    pair_to_chain.clear()
+    for chain, jseq in seq.items():
+        for a, b in zip(jseq, jseq[1:]):
+            pair_to_chain[(a, b)] = chain
+
+
+def build_junction_csr():
+    """Flatten junction_graph into CSR arrays for array-based Dijkstra."""
+    global csr_indptr, csr_indices, csr_weights
+    global rev_indptr, rev_indices, rev_wslot
+    routing_graph = contracted_graph if contracted_graph else junction_graph
+    junc_list[:] = sorted(routing_graph)
+    junc_index.clear()
+    junc_index.update((jid, i) for i, jid in enumerate(junc_list))
+    if np is None:
+        return
+    indptr = np.empty(len(junc_list) + 1, dtype=np.int32)
+    indices = []
+    weights = []
+    indptr[0] = 0
+    for i, jid in enumerate(junc_list):
+        for to_j, w in routing_graph[jid].items():
+            edge_slot[(i, junc_index[to_j])] = len(indices)
+            indices.append(junc_index[to_j])
+            weights.append(w)
+        indptr[i + 1] = len(indices)
+    csr_indptr = indptr
+    csr_indices = np.array(indices, dtype=np.int32)
+    csr_weights = np.array(weights, dtype=np.float64)
+    # reverse adjacency for the backward half of bidirectional search;
+    # weights are read through rev_wslot so the in-place updates of
+    # csr_weights stay visible without a second weight array
+    n = len(junc_list)
+    incoming = [[] for _ in range(n)]
+    for i in range(n):
+        for k in range(indptr[i], indptr[i + 1]):
+            incoming[csr_indices[k]].append((i, k))
+    rev_indptr = np.empty(n + 1, dtype=np.int32)
+    r_indices = []
+    r_wslot = []
+    rev_indptr[0] = 0
+    for j in range(n):
+        for i, k in incoming[j]:
+            r_indices.append(i)
+            r_wslot.append(k)
+        rev_indptr[j + 1] = len(r_indices)
+    rev_indices = np.array(r_indices, dtype=np.int32)
+    rev_wslot = np.array(r_wslot, dtype=np.int32)
+    global node_xy
+    node_xy = np.array([node_coords[jid] for jid in junc_list],
+                       dtype=np.float64)
+
+
+def build_edge_tables():
+    """Intern edge ids into the parallel lookup tables above."""
+    global edge_row_from, edge_row_to, edge_wslot
+    edge_index.clear()
+    del edge_from_j[:], edge_to_j[:], edge_chain[:], edge_ff[:]
+    rows_f = []
+    rows_t = []
+    wslots = []
+    for eid, (fj, tj) in edge_to_junction.items():
+        edge_index[eid] = len(edge_from_j)
+        edge_from_j.append(fj)
+        edge_to_j.append(tj)
+        fi = junc_index.get(fj, -1)
+        ti = junc_index.get(tj, -1)
+        rows_f.append(fi)
+        rows_t.append(ti)
+        wslots.append(edge_slot.get((fi, ti), -1)
+                      if fi >= 0 and ti >= 0 else -1)
+        edge_chain.append(pair_to_chain.get((fj, tj)))
+        edge_ff.append(edge_freeflow.get(eid, 0.0))
+    if np is not None:
+        edge_row_from = np.array(rows_f, dtype=np.int32)
+        edge_row_to = np.array(rows_t, dtype=np.int32)
+        edge_wslot = np.array(wslots, dtype=np.int32)
+    else:
+        edge_row_from, edge_row_to, edge_wslot = rows_f, rows_t, wslots
+
+
+def load_network():
+    """Parse the scenario network, skipping data the scripts never use."""
+    return sumolib.net.readNet(NET_FILE, withInternal=False,
+                               withPedestrianConnections=False,
+                               withPrograms=False)
+
+
+def initialize_graph_with_defaults():
+    """Seed every junction pair that has an edge with its free-flow time."""
+    for edge in net.getEdges(withInternal=False):
+        eid = edge.getID()
+        from_j = edge.getFromNode().getID()
+        to_j = edge.getToNode().getID()
+        edge_to_junction[eid] = (from_j, to_j)
+        max_speed = max((lane.getSpeed() for lane in edge.getLanes()),
+                        default=1.0)
+        global max_net_speed
+        max_net_speed = max(max_net_speed, max_speed)
+        tt = edge.getLength() / max_speed
+        edge_max_speed[eid] = max_speed
+        edge_freeflow[eid] = tt
+        junction_graph.setdefault(from_j, {})
+        prev = junction_graph[from_j].get(to_j)
+        if prev is None or tt < prev:
+            junction_graph[from_j][to_j] = tt
+            # canonical edge for this junction pair: the fastest one
+            junc_out_edges.setdefault(from_j, {})[to_j] = eid
+    for node in net.getNodes():
+        jid = node.getID()
+        junction_graph.setdefault(jid, {})
+        node_coords[jid] = node.getCoord()
+
+
+def save_net_cache():
+    """Pickle the tables derived from the net file, tagged with its mtime."""
+    with open(NET_CACHE, "wb") as f:
+        pickle.dump({"mtime": os.path.getmtime(NET_FILE),
+                     "edge_to_junction": edge_to_junction,
+                     "junc_out_edges": junc_out_edges,
+                     "junction_graph": junction_graph,
+                     "node_coords": node_coords,
+                     "edge_max_speed": edge_max_speed,
+                     "edge_freeflow": edge_freeflow,
+                     "max_net_speed": max_net_speed}, f,
+                    pickle.HIGHEST_PROTOCOL)
+
+
+def load_net_cache():
+    """Restore the derived tables if the net file has not changed.
+
+    Returns True on a hit, in which case the XML parse is skipped
+    entirely and *net* stays None.
+    """
+    global max_net_speed
+    if not os.path.exists(NET_CACHE):
+        return False
+    try:
+        with open(NET_CACHE, "rb") as f:
+            data = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return False
+    if data.get("mtime") != os.path.getmtime(NET_FILE):
+        return False
+    edge_to_junction.update(data["edge_to_junction"])
+    junc_out_edges.update(data["junc_out_edges"])
+    junction_graph.update(data["junction_graph"])
+    node_coords.update(data["node_coords"])
+    edge_max_speed.update(data["edge_max_speed"])
+    edge_freeflow.update(data["edge_freeflow"])
+    max_net_speed = data["max_net_speed"]
+    return True
+
+
+def save_graph_to_csv():
+    """Persist the learned junction graph for the next run."""
+    with open(GRAPH_CSV, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["From", "To", "AvgTime"])
+        writer.writeheader()
+        for from_j, nbrs in junction_graph.items():
+            for to_j, avg in nbrs.items():
+                writer.writerow({"From": from_j, "To": to_j,
+                                 "AvgTime": "%.3f" % avg})
+
+
+def load_graph_from_csv():
+    """Restore learned weights; unknown junction pairs are ignored."""
+    with open(GRAPH_CSV, newline="") as f:
+        for row in csv.DictReader(f):
+            nbrs = junction_graph.get(row["From"])
+            if nbrs is not None and row["To"] in nbrs:
+                nbrs[row["To"]] = float(row["AvgTime"])
+
+
+def save_graph():
+    """Persist the learned weights, binary by default.
+
+    One contiguous savez of flat from/to/weight arrays built from the
+    full junction_graph replaces formatting every weight through
+    csv.DictWriter. The routing CSR is post-contraction and must not
+    be dumped: chain-interior pairs are missing from it and contracted
+    hops carry summed times, so it cannot round-trip the learned dict.
+    """
+    if np is None or USE_CSV_GRAPH:
+        save_graph_to_csv()
+        return
+    froms = []
+    tos = []
+    weights = []
+    for from_j, nbrs in junction_graph.items():
+        for to_j, avg in nbrs.items():
+            froms.append(from_j)
+            tos.append(to_j)
+            weights.append(avg)
+    np.savez_compressed(GRAPH_NPZ, froms=np.array(froms),
+                        tos=np.array(tos),
+                        weights=np.array(weights, dtype=np.float64))
+
+
+def load_graph_from_npz():
+    """Restore learned weights from the binary dump.
+
+    Weights are matched by junction name, so a dump from an older net
+    applies only where the pair still exists.
+    """
+    data = np.load(GRAPH_NPZ, allow_pickle=False)
+    froms = data["froms"]
+    tos = data["tos"]
+    weights = data["weights"]
+    for i in range(froms.shape[0]):
+        nbrs = junction_graph.get(str(froms[i]))
+        if nbrs is None:
+            continue
+        to_j = str(tos[i])
+        if to_j in nbrs:
+            nbrs[to_j] = float(weights[i])
+
+
+def update_travel_stats(veh_id, current_edge, sim_time):
+    """Record the traversal time of the edge the vehicle just left."""
+    st = vehicle_states[veh_id]
+    prev_edge = st["last_edge"]
+    if prev_edge == current_edge:
+        return
+    if prev_edge is not None:
+        pi = edge_index.get(prev_edge, -1)
+        ci = edge_index.get(current_edge, -1)
+        # only count transitions that really leave via this junction;
+        # the new edge must start where the old one ended
+        if pi >= 0 and ci >= 0 and edge_from_j[ci] == edge_to_j[pi]:
+            duration = sim_time - st["edge_enter"]
+            stat = junction_stats.get(pi)
+            if stat is None:
+                stat = junction_stats[pi] = [deque(maxlen=STATS_WINDOW),
+                                             0.0]
+            dq, running = stat
+            if len(dq) == STATS_WINDOW:
+                running -= dq[0]  # deque drops this sample on append
+            dq.append(duration)
+            running += duration
+            stat[1] = running
+            avg = running / len(dq)
+            if avg < edge_ff[pi]:
+                # a sample cannot legitimately beat free flow; clock
+                # boundaries on very short edges occasionally do
+                avg = edge_ff[pi]
+            from_junc = edge_from_j[pi]
+            to_junc = edge_to_j[pi]
+            old = junction_graph[from_junc].get(to_junc, 0.0)
+            junction_graph[from_junc][to_junc] = avg
+            if old <= 0.0 or abs(avg - old) / old > EPOCH_BUMP_REL:
+                # cached paths may be stale now; small jitter is not
+                # worth throwing the whole cache away
+                global graph_epoch
+                graph_epoch += 1
+            if csr_weights is not None:
+                chain = edge_chain[pi]
+                if chain is not None:
+                    # refresh the summed weight of the contracted hop
+                    jseq = expansion_map[chain]
+                    total = 0.0
+                    for a, b in zip(jseq, jseq[1:]):
+                        total += junction_graph[a][b]
+                    slot = edge_slot.get((junc_index[chain[0]],
+                                          junc_index[chain[1]]))
+                    if slot is not None:
+                        csr_weights[slot] = total
+                else:
+                    slot = edge_wslot[pi]
+                    if slot >= 0:
+                        csr_weights[slot] = avg
+            # isEnabledFor keeps the disabled case free of any
+            # formatting or call-argument work in this hot loop
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("TQ (%s -> %s): %.1fs over %d samples",
+                          from_junc, to_junc, avg, len(dq))
+    st["last_edge"] = current_edge
+    st["edge_enter"] = sim_time
+
+
+def expand_junction_path(junction_path):
+    """Replace contracted hops with their recorded junction sequences."""
+    if not expansion_map:
+        return junction_path
+    full = [junction_path[0]]
+    for u, w in zip(junction_path, junction_path[1:]):
+        jseq = expansion_map.get((u, w))
+        if jseq is not None:
+            full.extend(jseq[1:])
+        else:
+            full.append(w)
+    return full
+
+
+def junctions_to_edges(junction_path):
+    """Translate a junction path into the edge ids connecting it."""
+    edges = []
+    junction_path = expand_junction_path(junction_path)
+    for from_j, to_j in zip(junction_path, junction_path[1:]):
+        candidate = junc_out_edges.get(from_j, _EMPTY).get(to_j)
+        if candidate is None:
+            return None
+        edges.append(candidate)
+    return edges
+
+
+_INF = float("inf")
+_EMPTY = {}
+
+
+def bidir_astar(src, dst):
+    """Goal-directed point-to-point search over the CSR arrays.
+
+    Bidirectional A* with the averaged potential
+    pi(u) = (||u - dst|| - ||u - src||) / (2 * max_net_speed), which is
+    consistent and sums to zero between the directions, so the plain
+    meet-in-the-middle stopping rule remains valid while both frontiers
+    are pulled toward each other. Returns the junction-id path or None.
+    """
+    sx, sy = node_xy[src]
+    tx, ty = node_xy[dst]
+    scale = 2.0 * max_net_speed
+
+    def pi(u):
+        x, y = node_xy[u]
+        return (hypot(x - tx, y - ty) - hypot(x - sx, y - sy)) / scale
+
+    dist_f = {src: 0.0}
+    dist_b = {dst: 0.0}
+    prev_f = {}
+    prev_b = {}
+    done_f = set()
+    done_b = set()
+    heap_f = [(pi(src), src)]
+    heap_b = [(-pi(dst), dst)]
+    best = _INF
+    meet = -1
+    while heap_f and heap_b:
+        if heap_f[0][0] + heap_b[0][0] >= best:
+            break
+        if len(heap_f) <= len(heap_b):
+            _key, u = heapq.heappop(heap_f)
+            if u in done_f:
+                continue
+            done_f.add(u)
+            d = dist_f[u]
+            for k in range(csr_indptr[u], csr_indptr[u + 1]):
+                v = csr_indices[k]
+                alt = d + csr_weights[k]
+                if alt < dist_f.get(v, _INF):
+                    dist_f[v] = alt
+                    prev_f[v] = u
+                    heapq.heappush(heap_f, (alt + pi(v), v))
+                    db = dist_b.get(v)
+                    if db is not None and alt + db < best:
+                        best = alt + db
+                        meet = v
+        else:
+            _key, u = heapq.heappop(heap_b)
+            if u in done_b:
+                continue
+            done_b.add(u)
+            d = dist_b[u]
+            for k in range(rev_indptr[u], rev_indptr[u + 1]):
+                v = rev_indices[k]
+                alt = d + csr_weights[rev_wslot[k]]
+                if alt < dist_b.get(v, _INF):
+                    dist_b[v] = alt
+                    prev_b[v] = u
+                    heapq.heappush(heap_b, (alt - pi(v), v))
+                    df = dist_f.get(v)
+                    if df is not None and df + alt < best:
+                        best = df + alt
+                        meet = v
+    if meet < 0:
+        return None
+    nodes = [meet]
+    i = meet
+    while i != src:
+        i = prev_f[i]
+        nodes.append(i)
+    nodes.reverse()
+    i = meet
+    while i != dst:
+        i = prev_b[i]
+        nodes.append(i)
+    return [junc_list[i] for i in nodes]
+
+
+ELLIPSE_SLACK = 1.5  # detour factor allowed inside the pruning ellipse
+
+
+def ellipse_mask(src, dst):
+    """uint8 mask of nodes worth expanding for a src->dst query.
+
+    Most reroutes cover a small patch of the network, so the search is
+    restricted to the ellipse dist(u,src) + dist(u,dst) <= 1.5 * D with
+    D the straight-line query distance. Shortest paths with less than
+    50% geometric detour are unaffected; the caller falls back to the
+    full graph when the pruned search finds nothing.
+    """
+    if node_xy is None:
+        return None
+    sx, sy = node_xy[src]
+    tx, ty = node_xy[dst]
+    d = hypot(tx - sx, ty - sy)
+    if d <= 0.0:
+        return None
+    xs = node_xy[:, 0]
+    ys = node_xy[:, 1]
+    reach = (np.hypot(xs - sx, ys - sy) + np.hypot(xs - tx, ys - ty)
+             <= ELLIPSE_SLACK * d)
+    return reach.view(np.uint8)
+
+
+def path_from_prev(prev, src, dst):
+    """Junction-id path recovered from a predecessor tree, or None."""
+    if src != dst and prev[dst] < 0:
+        return None
+    nodes = [dst]
+    i = dst
+    while i != src:
+        i = prev[i]
+        if i < 0:
+            return None
+        nodes.append(i)
+    nodes.reverse()
+    return [junc_list[i] for i in nodes]
+
+
+REROUTE_LB_SLACK = 1.1  # keep routes within 10% of the geometric bound
+
+
+def route_near_optimal(route, current_edge, fi, ti):
+    """True when the remaining route already rules out any improvement.
+
+    No path can beat straight-line distance at the network's top speed,
+    so a remaining cost within REROUTE_LB_SLACK of that bound means the
+    search could only confirm what the vehicle is already driving.
+    """
+    try:
+        start = route.index(current_edge)
+    except ValueError:
+        return False
+    cost = 0.0
+    for eid in route[start:]:
+        k = edge_index.get(eid, -1)
+        if k < 0:
+            return False
+        s = edge_wslot[k]
+        if s >= 0:
+            cost += csr_weights[s]
+        else:
+            cost += junction_graph[edge_from_j[k]].get(edge_to_j[k],
+                                                       edge_ff[k])
+    sx, sy = node_xy[fi]
+    tx, ty = node_xy[ti]
+    lb = hypot(tx - sx, ty - sy) / max_net_speed
+    return lb > 0.0 and cost <= REROUTE_LB_SLACK * lb
+
+
+def path_from_tree(tree, src, dst):
+    """Path along a backward tree, where tree[u] is the next hop to dst."""
+    if src != dst and tree[src] < 0:
+        return None
+    nodes = [src]
+    i = src
+    while i != dst:
+        i = tree[i]
+        if i < 0:
+            return None
+        nodes.append(i)
+    return [junc_list[i] for i in nodes]
+
+
+def _cache_path(key, path):
+    """LRU-insert a finished search result."""
+    path_cache[key] = (graph_epoch, path)
+    path_cache.move_to_end(key)
+    if len(path_cache) > PATH_CACHE_MAX:
+        path_cache.popitem(last=False)
+
+
+def _finish_reroute(veh_id, current_edge, path, sim_time):
+    """Push a computed junction path onto the vehicle."""
+    if not path or len(path) < 2:
+        return
+    edges = junctions_to_edges(path)
+    if not edges:
+        return
+    try:
+        traci.vehicle.setRoute(veh_id, [current_edge] + edges)
+    except traci.TraCIException:
+        return
+    vehicle_states[veh_id]["last_reroute_time"] = sim_time
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("[Dijkstra] Recomputed route for %s: %d edges",
+                  veh_id, len(edges))
+
+
+def try_reroute_vehicle(veh_id, current_edge, route, sim_time, groups=None):
+    """Recompute the vehicle's route on the learned junction graph.
+
+    With *groups*, searches that miss the path cache are deferred into
+    it keyed by destination row, so vehicles heading the same way share
+    one backward search in process_reroute_groups.
+    """
+    st = vehicle_states[veh_id]
+    # cheap guards first: don't pay for a search that will be discarded
+    if sim_time - st["last_reroute_time"] <= REROUTE_MIN_INTERVAL:
+        return
+    ctx = (current_edge, graph_epoch)
+    if st.get("last_reroute_ctx") == ctx:
+        return  # same edge, unchanged weights: the answer is the same
+    ei = edge_index.get(current_edge, -1)
+    if ei < 0 or not route:
+        return
+    di = edge_index.get(route[-1], -1)
+    if di < 0:
+        return
+    via_junc = edge_to_j[ei]
+    dest_junc = edge_to_j[di]
+    if via_junc == dest_junc:
+        return
+    st["last_reroute_ctx"] = ctx
+    if csr_weights is not None:
+        fi = edge_row_to[ei]
+        ti = edge_row_to[di]
+        if fi < 0 or ti < 0:
+            # inside a contracted chain: no routing alternative here
+            return
+        key = (int(fi), int(ti))
+        hit = path_cache.get(key)
+        if hit is not None and hit[0] == graph_epoch:
+            path_cache.move_to_end(key)
+            path = hit[1]
+        elif route_near_optimal(route, current_edge, key[0], key[1]):
+            return  # current route already at the admissible bound
+        elif groups is not None and sssp is not None:
+            groups.setdefault(key[1], []).append((veh_id, current_edge,
+                                                  key[0]))
+            return
+        else:
+            path = bidir_astar(key[0], key[1])
+            _cache_path(key, path)
+    else:
+        dijk = Dijkstra(junction_graph, via_junc)
+        dijk.dijkstra()
+        path = dijk.build_path(dest_junc)
+    _finish_reroute(veh_id, current_edge, path, sim_time)
+
+
+def process_reroute_groups(groups, sim_time):
+    """Run the searches deferred by try_reroute_vehicle, one per group.
+
+    A destination wanted by several vehicles gets a single backward
+    Dijkstra over the reverse CSR whose tree serves the whole group;
+    singletons keep the cheaper ellipse-pruned forward search.
+    """
+    rev_weights = None
+    for ti, members in groups.items():
+        if len(members) == 1:
+            veh_id, current_edge, fi = members[0]
+            mask = ellipse_mask(fi, ti)
+            _dist, prev = sssp(csr_indptr, csr_indices,
+                               csr_weights, fi, allowed=mask)
+            path = path_from_prev(prev, fi, ti)
+            if path is None and mask is not None:
+                # pruned too hard (detour beyond the ellipse);
+                # retry over the whole graph
+                _dist, prev = sssp(csr_indptr, csr_indices,
+                                   csr_weights, fi)
+                path = path_from_prev(prev, fi, ti)
+            _cache_path((fi, ti), path)
+            _finish_reroute(veh_id, current_edge, path, sim_time)
+            continue
+        if rev_weights is None:
+            # reverse arcs read the live forward weights through their
+            # slot mapping; one gather per step they are needed
+            rev_weights = csr_weights[rev_wslot]
+        _dist, tree = sssp(rev_indptr, rev_indices, rev_weights, ti)
+        for veh_id, current_edge, fi in members:
+            path = path_from_tree(tree, fi, ti)
+            _cache_path((fi, ti), path)
+            _finish_reroute(veh_id, current_edge, path, sim_time)
+
+
+def run_simulation():
+    global net
+    if not load_net_cache():
+        net = load_network()
+        initialize_graph_with_defaults()
+        save_net_cache()
+    if (np is not None and not USE_CSV_GRAPH
+            and os.path.exists(GRAPH_NPZ)):
+        load_graph_from_npz()
+    elif os.path.exists(GRAPH_CSV):
+        load_graph_from_csv()
+    contract_junction_chains()
+    build_junction_csr()
+    build_edge_tables()
+
+    traci.start([sumolib.checkBinary("sumo"), "-c", SUMO_CFG])
+    step_sec = traci.simulation.getDeltaT()
+    traci.simulation.subscribe(SIM_VARS)
+
+    total_travel = total_wait = total_co2 = 0.0
+    n_finished = 0
+
+    while traci.simulation.getMinExpectedNumber() > 0:
+        traci.simulationStep()
+        sim_sub = traci.simulation.getSubscriptionResults()
+        sim_time = sim_sub.get(tc.VAR_TIME, 0.0)
+
+        # register departures; the subscription makes every later read
+        # part of the one bulk result instead of per-vehicle RPCs
+        for vid in sim_sub.get(tc.VAR_DEPARTED_VEHICLES_IDS) or ():
+            vehicle_states[vid] = {"depart": sim_time,
+                                   "last_edge": None,
+                                   "edge_enter": sim_time,
+                                   "last_reroute_time": -REROUTE_MIN_INTERVAL,
+                                   "last_reroute_ctx": None}
+            if np is not None:
+                _claim_slot(vid)
+            else:
+                vehicle_states[vid]["co2_mg"] = 0.0
+                vehicle_states[vid]["waiting_time"] = 0.0
+            traci.vehicle.subscribe(vid, VEH_VARS)
+
+        subs = traci.vehicle.getAllSubscriptionResults()
+        if np is not None and subs:
+            nsub = len(subs)
+            rows = np.fromiter((veh_slot[v] for v in subs),
+                               dtype=np.int64, count=nsub)
+            co2_arr[rows] += np.fromiter(
+                (d.get(tc.VAR_CO2EMISSION, 0.0) for d in subs.values()),
+                dtype=np.float64, count=nsub) * step_sec
+            curr = np.fromiter(
+                (d.get(tc.VAR_ACCUMULATED_WAITING_TIME, 0.0)
+                 for d in subs.values()), dtype=np.float64, count=nsub)
+            # the accumulated value is windowed by SUMO, so integrate
+            # the positive deltas instead of keeping the raw reading
+            wait_arr[rows] += np.maximum(0.0, curr - last_wait_arr[rows])
+            last_wait_arr[rows] = curr
+        reroute_groups = {}
+        for vid, d in subs.items():
+            st = vehicle_states.get(vid)
+            if st is None:
+                continue
+            if np is None:
+                st["co2_mg"] += d.get(tc.VAR_CO2EMISSION, 0.0) * step_sec
+                st["waiting_time"] = d.get(tc.VAR_ACCUMULATED_WAITING_TIME,
+                                           0.0)
+            current_edge = d.get(tc.VAR_ROAD_ID, "")
+            if not current_edge or current_edge.startswith(":"):
+                continue
+            update_travel_stats(vid, current_edge, sim_time)
+            try_reroute_vehicle(vid, current_edge,
+                                d.get(tc.VAR_EDGES) or (), sim_time,
+                                reroute_groups)
+        if reroute_groups:
+            process_reroute_groups(reroute_groups, sim_time)
+
+        # a teleport skips the edge physically, so the pending traversal
+        # measurement would be garbage; restart it on the next edge
+        for vid in sim_sub.get(tc.VAR_TELEPORT_ENDING_VEHICLES_IDS) or ():
+            st = vehicle_states.get(vid)
+            if st is not None:
+                st["last_edge"] = None
+                st["edge_enter"] = sim_time
+
+        # arrivals come out of the same subscription packet; SUMO drops
+        # the vehicle's own subscription automatically
+        for vid in sim_sub.get(tc.VAR_ARRIVED_VEHICLES_IDS) or ():
+            st = vehicle_states.pop(vid, None)
+            if st is None:
+                continue
+            if np is not None:
+                i = veh_slot.pop(vid)
+                _free_slots.append(i)
+                total_wait += wait_arr[i]
+                total_co2 += co2_arr[i]
+            else:
+                total_wait += st["waiting_time"]
+                total_co2 += st["co2_mg"]
+            total_travel += sim_time - st["depart"]
+            n_finished += 1
+
+    traci.close()
+    save_graph()
+
+    avg_travel = total_travel / n_finished if n_finished else 0.0
+    avg_wait = total_wait / n_finished if n_finished else 0.0
+    write_header = not os.path.exists(AGG_CSV)
+    with open(AGG_CSV, "a") as f:
+        if write_header:
+            f.write("vehicles,avg_travel_time_s,avg_waiting_time_s,"
+                    "total_co2_g\n")
+        f.write(f"{n_finished},{avg_travel:.3f},{avg_wait:.3f},"
+                f"{total_co2 / 1000.0:.3f}\n")
+    print("Simulation ended: %d vehicles, avg travel %.1f s, avg waiting %.1f s"
+          % (n_finished, avg_travel, avg_wait))
+
+
+if __name__ == "__main__":
+    # per-transition/per-reroute chatter is DEBUG; pass --debug to see it
+    logging.basicConfig(
+        level=logging.DEBUG if "--debug" in sys.argv else logging.INFO)
+    run_simulation()